@@ -0,0 +1,97 @@
+"""
+Benchmark of the artifact codecs (see `pin.artifact.CODECS`) on synthetic state dicts.
+Reports the save and load throughputs (uncompressed MB per second, files fsynced on save) and the compression
+ratio of each codec, to choose one for a given storage. Point --path to the storage to benchmark.
+
+State dicts are made of float32 tensors (torch) or arrays (numpy, when torch is not installed):
+- "random": normally distributed weights, which compress little,
+- "sparse": weights with 90% of zeros, such as pruned layers or unused embeddings,
+- "mixed": half random and half sparse.
+
+Usage:
+    python benchmarks/bench_artifact_codecs.py [--size 256] [--state mixed] [--repeat 3] [--path /tmp]
+"""
+import argparse
+import importlib.util
+import io
+import pickle
+import tempfile
+import time
+
+import numpy as np
+
+from pin.artifact import Artifact, CODECS
+
+MB = 2 ** 20
+
+
+class NumpyArtifact(Artifact):
+    def write(self, content, file, **kwargs):
+        pickle.dump(content, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, version="best", **kwargs):
+        with self.open_file(self.file_name(version)) as file:
+            return pickle.load(file)
+
+
+def make_state(size, state, num_tensors=32):
+    rng = np.random.default_rng(0)
+    numel = size * MB // 4 // num_tensors
+    tensors = dict()
+    for k in range(num_tensors):
+        weights = rng.standard_normal(numel, dtype=np.float32)
+        if state == "sparse" or (state == "mixed" and k % 2):
+            weights[rng.random(numel) < 0.9] = 0
+        tensors[f"layer{k}.weight"] = weights
+    return tensors
+
+
+def make_artifact(path, codec, tensors):
+    if importlib.util.find_spec("torch") is None:
+        artifact = NumpyArtifact(path, "model_{version}.pkl", codec=codec, num_kept_versions=1)
+        artifact.update(tensors)
+        return artifact, lambda: artifact.load(version=artifact.version - 1)
+
+    import torch
+    from pin.artifact import TorchModelArtifact
+
+    artifact = TorchModelArtifact(path, "model_{version}.pt", codec=codec, num_kept_versions=1)
+    artifact.update({key: torch.from_numpy(value) for key, value in tensors.items()})
+    return artifact, lambda: artifact.load(dict(), version=artifact.version - 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=256, help="size of the state dict in MB")
+    parser.add_argument("--state", choices=["random", "sparse", "mixed"], default="mixed")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--path", default=None, help="directory to write the checkpoints in")
+    args = parser.parse_args()
+
+    tensors = make_state(args.size, args.state)
+    size = sum(value.nbytes for value in tensors.values())
+    print(f"{size / MB:.0f}MB {args.state} state dict")
+    for name, codec in CODECS.items():
+        try:
+            with codec().writer(io.BytesIO()):
+                pass
+        except ImportError as error:
+            print(f"{name:>5}: skipped ({error})")
+            continue
+        with tempfile.TemporaryDirectory(dir=args.path) as path:
+            artifact, load = make_artifact(path, name, tensors)
+            save_times, load_times = [], []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                artifact.checkpoint()
+                save_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                load()
+                load_times.append(time.perf_counter() - start)
+            ratio = size / artifact.saved_versions[artifact.version - 1]["size"]
+        print(f"{name:>5}: save {size / MB / min(save_times):7.1f}MB/s, "
+              f"load {size / MB / min(load_times):7.1f}MB/s, ratio {ratio:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark of the scanning of config values for imports.
+Compares the previous approach of `_update_values` (regex built and `re.finditer` called on each value,
+then the value is read, replaced and written back in the configuration for each import) with
+`pin.config.split_imports` and `pin.config.join_imports`, which write each value once.
+
+Usage:
+    python benchmarks/bench_config_scanner.py [--leaves 5000] [--repeat 5]
+"""
+import argparse
+import re
+import timeit
+
+from omegaconf import OmegaConf
+
+from pin.config import has_imports, join_imports, split_imports
+
+
+def legacy_import_matches(conf):
+    allowed_characters = r"[\w\.%_ \\,-]"
+    regex = r"@{(" + allowed_characters + r"+)(:(" + allowed_characters + r"*?))?}"
+    for match in re.finditer(regex, conf):
+        yield match
+
+
+def legacy_resolve(values, imported):
+    conf = OmegaConf.create(values)
+    for item, value in values.items():
+        for match in legacy_import_matches(value):
+            source = match.group(1).strip().replace('.', '/') + '.yaml'
+            var = match.group(3).strip().split('.')
+            content = imported[source][var[0]]
+            conf[item] = conf[item].replace(match.group(0), content.strip())
+    return conf
+
+
+def resolve(values, imported):
+    conf = OmegaConf.create(values)
+    for item, value in values.items():
+        segments = split_imports(value)
+        if has_imports(segments):
+            conf[item] = join_imports(segments, lambda reference: imported[reference.source][reference.var[0]])
+    return conf
+
+
+def make_values(num_leaves, imports_per_value):
+    values = dict()
+    for k in range(num_leaves):
+        if k % 4:
+            # Most values do not import anything.
+            values[f"key{k}"] = f"plain value number {k}"
+        else:
+            values[f"key{k}"] = "/".join(f"@{{vault:key{i}}}" for i in range(imports_per_value))
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--leaves", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for imports_per_value in [1, 10, 100]:
+        values = make_values(args.leaves, imports_per_value)
+        imported = {"vault.yaml": {f"key{i}": f"value{i}" for i in range(imports_per_value)}}
+        assert legacy_resolve(values, imported) == resolve(values, imported)
+
+        legacy_time = min(timeit.repeat(lambda: legacy_resolve(values, imported), number=1, repeat=args.repeat))
+        new_time = min(timeit.repeat(lambda: resolve(values, imported), number=1, repeat=args.repeat))
+        print(f"{args.leaves} leaves, {imports_per_value} imports per importing value: "
+              f"legacy {legacy_time * 1000:.1f}ms, split/join {new_time * 1000:.1f}ms "
+              f"(x{legacy_time / new_time:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Micro-benchmark of the ingestion of per-sample metrics in `pin.Metrics`.
+Compares adding the values one by one (`Metrics.add`, as `step(content_dict=...)` does) with
+`Metrics.add_batch`, which reduces NumPy arrays with vectorized operations.
+
+Usage:
+    python benchmarks/bench_metrics_ingestion.py [--samples 1000000] [--keys 4] [--batch 1024] [--repeat 3]
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from pin.metrics import Metrics
+
+
+def per_value(values, batch):
+    metrics = Metrics()
+    for start in range(0, len(values[0]), batch):
+        for k, key_values in enumerate(values):
+            for value in key_values[start:start + batch]:
+                metrics.add(f"key{k}", value)
+    metrics.compute_average()
+    return metrics
+
+
+def batched(values, batch):
+    metrics = Metrics()
+    for start in range(0, len(values[0]), batch):
+        metrics.add_batch({f"key{k}": key_values[start:start + batch] for k, key_values in enumerate(values)})
+    metrics.compute_average()
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=1000000)
+    parser.add_argument("--keys", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    values = np.random.default_rng(0).random((args.keys, args.samples))
+    assert np.isclose(per_value(values[:, :10000], args.batch)["key0"], batched(values[:, :10000], args.batch)["key0"])
+
+    per_value_time = min(timeit.repeat(lambda: per_value(values, args.batch), number=1, repeat=args.repeat))
+    batched_time = min(timeit.repeat(lambda: batched(values, args.batch), number=1, repeat=args.repeat))
+    num_values = args.keys * args.samples
+    print(f"{args.keys} keys x {args.samples} samples, batches of {args.batch}: "
+          f"add {num_values / per_value_time / 1e6:.2f}M values/s, "
+          f"add_batch {num_values / batched_time / 1e6:.2f}M values/s (x{per_value_time / batched_time:.1f})")
+
+
+if __name__ == "__main__":
+    main()
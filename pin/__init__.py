@@ -1,6 +1,28 @@
+import importlib
+
 from .constants import DEBUG
-from .summary_writer import SummaryWriter
-from .metrics import Metrics
-from .artifact import TorchModelArtifact
-from .config import load_config
-from .sacred import Experiment, munchify
+
+# The public classes are imported on first access (PEP 562), so that `import pin` and the CLI do not import
+# sacred, omegaconf or numpy when they are not used.
+_lazy_attributes = {
+    "SummaryWriter": ".summary_writer",
+    "Metrics": ".metrics",
+    "TorchModelArtifact": ".artifact",
+    "load_config": ".config",
+    "Experiment": ".sacred",
+    "munchify": ".sacred",
+}
+
+__all__ = ["DEBUG"] + list(_lazy_attributes.keys())
+
+
+def __getattr__(name):
+    if name not in _lazy_attributes:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_lazy_attributes[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(_lazy_attributes.keys()))
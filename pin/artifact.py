@@ -1,4 +1,14 @@
+import atexit
+import contextlib
+import copy
+import hashlib
+import io
+import json
 import os
+import queue
+import shutil
+import threading
+from collections import Counter
 from pathlib import Path
 from typing import Union
 import re
@@ -6,6 +16,412 @@ import re
 path_type = Union[Path, str]
 
 
+class BackgroundWriter:
+    """
+    Runs jobs one after the other in a background thread.
+    The queue is bounded: submitting blocks while max_pending jobs are waiting.
+    If a job fails, the following jobs are skipped and the error is raised by the next call to
+    `submit`, `wait` or `check`.
+    The submitted jobs are still run when the interpreter exits, unless the writer was closed.
+    """
+
+    def __init__(self, max_pending=2):
+        """
+        Args:
+            max_pending: maximum number of jobs waiting to be run. If 0, the queue is not bounded. Defaults to 2.
+        """
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self._close_at_exit)
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                if self.error is None:
+                    job()
+            except BaseException as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def check(self):
+        """
+        Raises the error of a failed job, if any.
+        """
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, job):
+        """
+        Args:
+            job: callable without arguments.
+        """
+        self.check()
+        self.queue.put(job)
+
+    def wait(self):
+        """
+        Waits for all the submitted jobs to be done.
+        """
+        self.queue.join()
+        self.check()
+
+    def close(self):
+        """
+        Runs the submitted jobs and stops the thread.
+        """
+        atexit.unregister(self._close_at_exit)
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def _close_at_exit(self):
+        self.close()
+        if self.error is not None:
+            print(f"A background job failed: {self.error!r}")
+
+
+def link_file(source, link_name):
+    """
+    Atomically points link_name to the content of source, without copying it if possible.
+    Uses a hard link, then a symbolic link, and copies the file as a last resort.
+    Directories (sharded artifacts) are linked with a symbolic link.
+    Args:
+        source: existing file or directory
+        link_name: path of the link. Replaced if it exists.
+    """
+    tmp_link_name = f"{link_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if os.path.isdir(source):
+            raise IsADirectoryError(source)
+        os.link(source, tmp_link_name)
+    except OSError:
+        try:
+            os.symlink(os.path.relpath(source, os.path.dirname(link_name)), tmp_link_name)
+        except OSError:
+            if os.path.isdir(source):
+                shutil.copytree(source, tmp_link_name)
+            else:
+                shutil.copyfile(source, tmp_link_name)
+    if os.path.isdir(link_name) and not os.path.islink(link_name):
+        shutil.rmtree(link_name)
+    os.replace(tmp_link_name, link_name)
+
+
+def remove_path(path):
+    """
+    Removes a file, a link or a directory, if it exists.
+    """
+    if os.path.islink(path) or os.path.isfile(path):
+        os.remove(path)
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
+
+
+SHARD_INDEX = "index.json"
+
+
+def shard_file_name(position, key):
+    key = re.sub(r"[^\w.-]", "_", str(key))
+    return f"{position}_{key}.shard"
+
+
+class ChecksumFile:
+    """
+    Binary file wrapper computing the size and the sha1 of what is written.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.hash = hashlib.sha1()
+        self.size = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += memoryview(data).nbytes
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    @property
+    def checksum(self):
+        return self.hash.hexdigest()
+
+
+@contextlib.contextmanager
+def atomic_open(filename):
+    """
+    Opens a temporary file to write, then fsyncs it and renames it to filename. If an error occurs,
+    filename is left untouched.
+    Args:
+        filename:
+    Yields: a ChecksumFile
+    """
+    tmp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_filename, "wb") as file:
+            checksum_file = ChecksumFile(file)
+            yield checksum_file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+class Codec:
+    """
+    Compression of the artifact files. The base codec does not compress.
+    Codecs are found back from the first bytes of the files (`magic`), so files written with different codecs
+    can be loaded with any of them.
+    """
+    name = "none"
+    magic = None
+
+    def writer(self, file):
+        """
+        Args:
+            file: binary file object to write the compressed data into
+        Returns: a context manager giving a binary file object to write the uncompressed data into.
+            The compressed stream is complete when it exits, `file` is not closed.
+        """
+        return contextlib.nullcontext(file)
+
+    def reader(self, file):
+        """
+        Args:
+            file: binary file object to read the compressed data from
+        Returns: a context manager giving a binary file object reading the uncompressed data.
+        """
+        return contextlib.nullcontext(file)
+
+
+class ZstdCodec(Codec):
+    """
+    Zstandard streaming compression (requires the `zstandard` package).
+    Compression uses `threads` worker threads (-1: one per CPU).
+    """
+    name = "zstd"
+    magic = b"\x28\xb5\x2f\xfd"
+
+    def __init__(self, level=3, threads=-1):
+        self.level = level
+        self.threads = threads
+
+    def writer(self, file):
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=self.level, threads=self.threads).stream_writer(file, closefd=False)
+
+    def reader(self, file):
+        import zstandard
+
+        return zstandard.ZstdDecompressor().stream_reader(file, closefd=False)
+
+
+class LZ4Codec(Codec):
+    """
+    LZ4 frame streaming compression (requires the `lz4` package). Faster but compresses less than zstd.
+    """
+    name = "lz4"
+    magic = b"\x04\x22\x4d\x18"
+
+    def __init__(self, level=0):
+        self.level = level
+
+    def writer(self, file):
+        import lz4.frame
+
+        return lz4.frame.LZ4FrameFile(file, mode="wb", compression_level=self.level)
+
+    def reader(self, file):
+        import lz4.frame
+
+        return lz4.frame.LZ4FrameFile(file, mode="rb")
+
+
+CODECS = {codec.name: codec for codec in (Codec, ZstdCodec, LZ4Codec)}
+
+
+def get_codec(codec=None):
+    """
+    Args:
+        codec: None, name of a codec ("none", "zstd" or "lz4") or Codec instance.
+    Returns: a Codec instance.
+    """
+    if codec is None:
+        return Codec()
+    if isinstance(codec, Codec):
+        return codec
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec}. Available codecs: {', '.join(CODECS.keys())}.")
+    return CODECS[codec]()
+
+
+def detect_codec(filename):
+    """
+    Returns: the Codec of a file, from its first bytes.
+    """
+    with open(filename, "rb") as file:
+        head = file.read(4)
+    for codec in CODECS.values():
+        if codec.magic is not None and head == codec.magic:
+            return codec()
+    return Codec()
+
+
+@contextlib.contextmanager
+def open_compressed(filename):
+    """
+    Opens a file written by an artifact, whatever its codec.
+    Yields: a binary file object reading the uncompressed data.
+    """
+    codec = detect_codec(filename)
+    with open(filename, "rb") as file, codec.reader(file) as stream:
+        yield stream
+
+
+class VersionsManifest:
+    """
+    Append-only manifest of the saved versions of an artifact, stored as json lines.
+    Records are either a saved version: {"version", "file", "metric", "size", "checksum"},
+    a new best version: {"best", "metric"} or removed versions: {"removed": [versions]}.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def append(self, record):
+        with open(self.path, "a") as file:
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def records(self):
+        """
+        Returns: list of the records. A truncated last line (interrupted write) is ignored.
+        """
+        records = []
+        with open(self.path, "r") as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+    def state(self):
+        """
+        Returns: dict with the saved versions ({version: record}), the best version and its metric.
+        """
+        state = dict(versions=dict(), best=None, best_metric=None)
+        for record in self.records():
+            if "version" in record:
+                state["versions"][record["version"]] = record
+            if "best" in record:
+                state["best"] = record["best"]
+                state["best_metric"] = record["metric"]
+            for version in record.get("removed", []):
+                state["versions"].pop(version, None)
+        return state
+
+
+class RetentionPolicy:
+    """
+    Chooses the versions of an artifact to keep when cleaning.
+    Policies only depend on the records of the saved versions, so they keep working after a resume.
+    """
+    # If True, the policy limits the versions kept by the other policies instead of adding its own.
+    is_limit = False
+
+    def keep(self, versions):
+        """
+        Args:
+            versions: dict {version: record} of the saved versions. Records contain the "metric" and
+                the "size" of the version, and the sizes of the blobs it uses ("blob_sizes") if any.
+        Returns: the set of versions to keep.
+        """
+        raise NotImplementedError
+
+
+class KeepLast(RetentionPolicy):
+    """
+    Keeps the n most recent versions.
+    """
+
+    def __init__(self, n):
+        self.n = n
+
+    def keep(self, versions):
+        if self.n <= 0:
+            return set()
+        return set(sorted(versions.keys())[-self.n:])
+
+
+class KeepTopK(RetentionPolicy):
+    """
+    Keeps the k versions with the highest metric.
+    """
+
+    def __init__(self, k):
+        self.k = k
+
+    def keep(self, versions):
+        if self.k <= 0:
+            return set()
+        with_metric = [version for version, record in versions.items() if record.get("metric") is not None]
+        return set(sorted(with_metric, key=lambda version: versions[version]["metric"])[-self.k:])
+
+
+class KeepEveryN(RetentionPolicy):
+    """
+    Keeps every version multiple of n.
+    """
+
+    def __init__(self, n):
+        self.n = n
+
+    def keep(self, versions):
+        return {version for version in versions.keys() if not version % self.n}
+
+
+class DiskQuota(RetentionPolicy):
+    """
+    Limits the total size of the kept versions. The most recent versions are kept first.
+    The blobs of the versions (see `Artifact.write_blob`) are counted once, even if several versions use them.
+    """
+    is_limit = True
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+
+    def keep(self, versions):
+        kept = set()
+        counted_blobs = set()
+        total_size = 0
+        for version in sorted(versions.keys(), reverse=True):
+            blob_sizes = versions[version].get("blob_sizes", dict())
+            total_size += versions[version].get("size", 0)
+            total_size += sum(size for blob, size in blob_sizes.items() if blob not in counted_blobs)
+            if total_size > self.max_bytes:
+                break
+            kept.add(version)
+            counted_blobs.update(blob_sizes.keys())
+        return kept
+
+
 class Artifact:
     """"
     Base class for artifacts.
@@ -13,7 +429,12 @@ class Artifact:
 
     def __init__(self, path: path_type, name: str,
                  num_kept_versions: int = 10,
-                 debug: bool = False):
+                 debug: bool = False,
+                 async_save: bool = False,
+                 max_pending_saves: int = 2,
+                 retention=None,
+                 sharded: bool = False,
+                 codec=None):
         """
 
         Args:
@@ -21,6 +442,18 @@ class Artifact:
             name: name of the artifact. Must montain the {version} token to update.
                 Example: "model_artifact_{version}.ext"
             num_kept_versions: Number of kept version of the artifact. Default: 10
+            async_save: if True, checkpoints are written in a background thread. Only a copy of the artifact
+                (see `snapshot`) is made in the calling thread. Use `wait` to wait for the writes.
+                Default: False
+            max_pending_saves: when async_save is True, maximum number of checkpoints waiting to be written.
+                `checkpoint` blocks when the limit is reached. Default: 2
+            retention: RetentionPolicy or list of policies choosing the versions kept by `clean`. A version is kept
+                if one of the policies keeps it, then limits (such as DiskQuota) are applied. The best version
+                is always kept. Default: KeepLast(num_kept_versions)
+            sharded: if True and the artifact is a dict, each version is a directory with one file per key
+                and an index, so that keys can be loaded independently. Default: False
+            codec: compression of the files: "none", "zstd", "lz4" or a Codec instance (to set the compression
+                level or the number of threads). Default: no compression
         """
         self.path = path if isinstance(path, Path) else Path(path)
         self.name = name
@@ -29,7 +462,21 @@ class Artifact:
         self.best_version_value = None
         self.artifact = dict()
         self.num_kept_versions = num_kept_versions
+        self.sharded = sharded
+        self.codec = get_codec(codec)
+        if retention is None:
+            retention = [KeepLast(num_kept_versions)]
+        self.retention = retention if isinstance(retention, (list, tuple)) else [retention]
         self.debug = debug
+        self.writer = BackgroundWriter(max_pending_saves) if async_save else None
+        self.manifest = VersionsManifest(self.path / (self.name.format(version="manifest") + ".jsonl"))
+        # Removes files in the background.
+        self.deleter = None
+        # Content-addressed files shared between versions (see `write_blob`).
+        self.blob_path = self.path / self.name.format(version="blobs")
+        self.blob_references = Counter()
+        self._pending_blob_deletions = set()
+        self._blobs_lock = threading.Lock()
 
         self.saved_versions = dict()
 
@@ -51,10 +498,30 @@ class Artifact:
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if exc_type is not None and not self.debug:
+        if exc_type is None:
+            self.wait()
+            return
+        if self.writer is not None:
+            try:
+                self.writer.wait()
+            except Exception as error:  # The original exception is the one raised.
+                print(f"An asynchronous save of the artifact failed: {error!r}")
+        if not self.debug:
             file_name = self.path / self.name.format(version="recovery")
             self.save(file_name)
 
+    def wait(self):
+        """
+        Waits for the asynchronous saves to be written, and raises their errors if any.
+        Does nothing if async_save is False.
+        """
+        if self.writer is not None:
+            self.writer.wait()
+        if self.deleter is not None:
+            self.deleter.wait()
+
+    flush = wait
+
     def checkpoint(self, metric=None, **kwargs):
         """
         Saves a checkpoint to self.path / name
@@ -67,13 +534,123 @@ class Artifact:
 
         """
         if not self.debug:
-            file_name = self.path / self.name.format(version=self.version)
-            self.save(file_name, **kwargs)
-            self.clean()
+            is_best = self.is_best(metric)
             self.version += 1
-            if self.is_best(metric):
-                file_name = self.path / self.name.format(version="best")
-                self.save(file_name, **kwargs)
+            version = self.version - 1
+            # Subclasses only overriding `save` write the current state.
+            if self.writer is None or not self._overrides_write():
+                self._write_checkpoint(self.state(), version, metric, is_best, **kwargs)
+            else:
+                content = self.snapshot()
+                self.writer.submit(lambda: self._write_checkpoint(content, version, metric, is_best, **kwargs))
+
+    def _write_checkpoint(self, content, version, metric=None, is_best=False, **kwargs):
+        file_name = self.path / self.name.format(version=version)
+        record = dict(version=version, file=file_name.name, metric=metric)
+        if self._overrides_write():
+            record.update(self._write_file(content, file_name, **kwargs))
+        else:
+            self.save(file_name, **kwargs)
+            record.update(size=os.path.getsize(file_name))
+        self.manifest.append(record)
+        self.saved_versions[version] = record
+        self.blob_references.update(record.get("blobs", []))
+        if is_best:
+            link_file(file_name, self.path / self.name.format(version="best"))
+            self.manifest.append(dict(best=version, metric=metric))
+        self.clean()
+
+    def _overrides_write(self):
+        return type(self).write is not Artifact.write
+
+    def _write_file(self, content, filename, **kwargs):
+        """
+        Writes atomically the content in filename.
+        Returns: dict with the size and sha1 checksum of the file, and the blobs it uses if any.
+        """
+        if self.sharded and type(content) == dict:
+            return self._write_shards(content, filename, **kwargs)
+        with atomic_open(filename) as file, self.codec.writer(file) as stream:
+            blobs = self.write(content, stream, **kwargs)
+        record = dict(size=file.size, checksum=file.checksum)
+        self._add_blobs(record, blobs)
+        return record
+
+    def _write_shards(self, content, filename, **kwargs):
+        """
+        Writes each key of content in its own file in the filename directory, with an index.
+        The directory is written under a temporary name and then renamed.
+        Returns: total size of the shards, and sha1 checksum of the index.
+        """
+        tmp_directory = Path(f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp")
+        remove_path(tmp_directory)
+        os.makedirs(tmp_directory)
+        try:
+            index = dict()
+            blobs = set()
+            for position, (key, value) in enumerate(content.items()):
+                shard_name = shard_file_name(position, key)
+                with atomic_open(tmp_directory / shard_name) as file, self.codec.writer(file) as stream:
+                    blobs.update(self.write(value, stream, **kwargs) or [])
+                index[key] = dict(file=shard_name, size=file.size, checksum=file.checksum)
+            with atomic_open(tmp_directory / SHARD_INDEX) as file:
+                file.write(json.dumps(index).encode())
+            remove_path(filename)
+            os.replace(tmp_directory, filename)
+        except BaseException:
+            remove_path(tmp_directory)
+            raise
+        record = dict(size=sum(shard["size"] for shard in index.values()), checksum=file.checksum)
+        self._add_blobs(record, blobs)
+        return record
+
+    def _add_blobs(self, record, blobs):
+        """
+        Adds the blobs used by a version and their sizes on disk to its record.
+        """
+        if blobs:
+            record["blobs"] = sorted(blobs)
+            record["blob_sizes"] = {key: os.path.getsize(self.blob_path / key) for key in record["blobs"]}
+
+    def write_blob(self, key, write):
+        """
+        Writes a content-addressed file in the blob folder, if it does not exist yet.
+        Versions using blobs must return their keys from `write`, so that blobs are removed by `clean`
+        once no kept version uses them.
+        Args:
+            key: hash of the content
+            write: function writing the content in a given binary file object.
+        Returns: path of the blob.
+        """
+        blob_file = self.blob_path / key
+        with self._blobs_lock:
+            # The blob is used again: its deletion is cancelled.
+            self._pending_blob_deletions.discard(key)
+            if os.path.isfile(blob_file):
+                return blob_file
+        os.makedirs(self.blob_path, exist_ok=True)
+        with atomic_open(blob_file) as file, self.codec.writer(file) as stream:
+            write(stream)
+        return blob_file
+
+    def _remove_blobs(self, keys):
+        for key in keys:
+            with self._blobs_lock:
+                if key in self._pending_blob_deletions:
+                    self._pending_blob_deletions.discard(key)
+                    remove_path(self.blob_path / key)
+
+    def shard_files(self, version, keys=None):
+        """
+        Args:
+            version: version of a sharded artifact
+            keys: keys to get. Defaults to all the keys.
+        Returns: dict {key: path of the shard}
+        """
+        directory = self.file_name(version)
+        with open(directory / SHARD_INDEX, "r") as index_file:
+            index = json.load(index_file)
+        return {key: directory / shard["file"] for key, shard in index.items() if keys is None or key in keys}
 
     def is_best(self, metric=None):
         """
@@ -91,6 +668,40 @@ class Artifact:
                 return True
         return False
 
+    def state(self):
+        """
+        Returns: the content of the artifact to write.
+        """
+        return self.artifact
+
+    def snapshot(self):
+        """
+        Returns: a copy of the content to write, which is not modified by further training.
+            Used by asynchronous saves.
+        """
+        return copy.deepcopy(self.state())
+
+    def write(self, content, file, **kwargs):
+        """
+        Write the content of the artifact
+        Args:
+            content: content given by `state` or `snapshot`
+            file: binary file object to write into
+            **kwargs:
+
+        Returns: None, or the keys of the blobs used by the content (see `write_blob`).
+        Subclasses overriding `save` instead are still supported, but are written synchronously, without
+        checksum, compression or sharding.
+        """
+        raise NotImplementedError
+
+    def open_file(self, filename):
+        """
+        Opens a file of the artifact to read it in `load`. Compressed files are decompressed on the fly.
+        Returns: a context manager giving a binary file object.
+        """
+        return open_compressed(filename)
+
     def save(self, filename, **kwargs):
         """
         Save the model
@@ -101,7 +712,19 @@ class Artifact:
         Returns:
 
         """
-        raise NotImplementedError
+        self._write_file(self.state(), filename, **kwargs)
+
+    def file_name(self, version):
+        """
+        Args:
+            version: version of the artifact, "best" or "recovery".
+        Returns: path of the file of the version. If the "best" link is missing, returns the file of the
+            best version.
+        """
+        file_name = self.path / self.name.format(version=version)
+        if version == "best" and self.best_version is not None and not os.path.exists(file_name):
+            return self.path / self.name.format(version=self.best_version)
+        return file_name
 
     def load(self, *params, version="best", **kwargs):
         """
@@ -115,6 +738,27 @@ class Artifact:
         """
         raise NotImplementedError
 
+    def restore_state(self):
+        """
+        Restores the saved versions, the best version and the blob references from the manifest, so that the next
+        checkpoints and `clean` continue from the saved ones.
+        Returns: the latest saved version, or None if the manifest does not record any.
+        """
+        if not self.manifest.exists():
+            return None
+        # Only versions completely written are in the manifest.
+        state = self.manifest.state()
+        if not len(state["versions"]):
+            return None
+        latest_model = max(state["versions"].keys())
+        self.version = latest_model + 1
+        self.best_version = state["best"]
+        self.best_version_value = state["best_metric"]
+        self.saved_versions = state["versions"]
+        self.blob_references = Counter(blob for record in self.saved_versions.values()
+                                       for blob in record.get("blobs", []))
+        return latest_model
+
     def resume(self, *params, use_recovery=True, **kwargs):
         """
         Same as load, but infers the version to load by taking either the recovery model if it exists, or the latest
@@ -126,9 +770,13 @@ class Artifact:
         Returns:
 
         """
-        models = os.listdir(self.path)
-        if use_recovery and self.name.format(version="recovery") in models:
+        latest_model = self.restore_state()
+        if use_recovery and os.path.exists(self.path / self.name.format(version="recovery")):
             return self.load(*params, version="recovery", **kwargs)
+        if latest_model is not None:
+            return self.load(*params, version=str(latest_model), **kwargs)
+        # Artifacts saved without manifest
+        models = os.listdir(self.path)
         latest_model = 1
         for model in models:
             match = re.match(self.name.format(version="([0-9]+)"), model)
@@ -138,16 +786,67 @@ class Artifact:
                     latest_model = int(model_version)
         return self.load(*params, version=str(latest_model), **kwargs)
 
+    def versions_to_keep(self):
+        """
+        Returns: the set of saved versions kept by the retention policies.
+        """
+        versions = self.saved_versions
+        policies = [policy for policy in self.retention if not policy.is_limit]
+        kept = set(versions.keys()) if not len(policies) else set()
+        for policy in policies:
+            kept |= policy.keep(versions)
+        for policy in self.retention:
+            if policy.is_limit:
+                kept = policy.keep({version: versions[version] for version in kept})
+        # The best version is kept.
+        if self.best_version in versions:
+            kept.add(self.best_version)
+        return kept
+
     def clean(self):
-        if os.path.isfile(self.path / self.name.format(version="recovery")):
-            os.remove(self.path / self.name.format(version="recovery"))
-        to_remove = sorted(self.saved_versions.keys())[:len(self.saved_versions.keys()) - self.num_kept_versions]
-        for index in to_remove:
-            os.remove(self.saved_versions[index])
-            del self.saved_versions[index]
+        """
+        Removes the recovery file and the versions not kept by the retention policies.
+        Files are removed in a background thread.
+        """
+        remove_path(self.path / self.name.format(version="recovery"))
+        kept = self.versions_to_keep()
+        to_remove = sorted(version for version in self.saved_versions.keys() if version not in kept)
+        if not len(to_remove):
+            return
+        removed_records = [self.saved_versions.pop(version) for version in to_remove]
+        self.manifest.append(dict(removed=to_remove))
+        files = [self.path / record["file"] for record in removed_records]
+        # Blobs are removed when no saved version uses them anymore.
+        unused_blobs = []
+        for record in removed_records:
+            self.blob_references.subtract(record.get("blobs", []))
+            unused_blobs.extend(blob for blob in record.get("blobs", []) if self.blob_references[blob] <= 0)
+        with self._blobs_lock:
+            self._pending_blob_deletions.update(unused_blobs)
+        if self.deleter is None:
+            self.deleter = BackgroundWriter(max_pending=0)
+        self.deleter.submit(lambda: [remove_path(file) for file in files])
+        if len(unused_blobs):
+            self.deleter.submit(lambda: self._remove_blobs(unused_blobs))
+
+
+BLOB_MARKER = "__pin_blob__"
 
 
 class TorchModelArtifact(Artifact):
+    def __init__(self, path: path_type, name: str, *args, dedup=False, dedup_min_bytes=4096, **kwargs):
+        """
+        Args:
+            dedup: if True, tensors are saved once in a content-addressed blob folder, and versions only
+                reference them. Tensors that did not change between checkpoints (such as frozen layers) are
+                not written again. Default: False
+            dedup_min_bytes: smaller tensors are saved in the version file. Default: 4096
+            Other arguments are the ones of `Artifact`.
+        """
+        super(TorchModelArtifact, self).__init__(path, name, *args, **kwargs)
+        self.dedup = dedup
+        self.dedup_min_bytes = dedup_min_bytes
+
     @staticmethod
     def _get_state_dict(item):
         from torch.nn import DataParallel
@@ -160,23 +859,129 @@ class TorchModelArtifact(Artifact):
             state_dict = item
         return state_dict
 
-    def save(self, filename, **kwargs):
+    @staticmethod
+    def _to_cpu(item):
         import torch
 
+        if isinstance(item, torch.Tensor):
+            return item.detach().to("cpu", copy=True)
+        if isinstance(item, dict):
+            return type(item)((key, TorchModelArtifact._to_cpu(value)) for key, value in item.items())
+        if isinstance(item, (list, tuple)):
+            return type(item)(TorchModelArtifact._to_cpu(value) for value in item)
+        return copy.deepcopy(item)
+
+    def state(self):
         artifact = self.artifact
         if type(artifact) != dict:
-            saved_artifact = self._get_state_dict(artifact)
-        else:
-            saved_artifact = dict()
-            for key, item in artifact.items():
-                saved_artifact[key] = self._get_state_dict(item)
-        torch.save(saved_artifact, filename)
+            return self._get_state_dict(artifact)
+        saved_artifact = dict()
+        for key, item in artifact.items():
+            saved_artifact[key] = self._get_state_dict(item)
+        return saved_artifact
+
+    def snapshot(self):
+        """
+        Returns: a copy of the state dicts in CPU memory.
+        """
+        return self._to_cpu(self.state())
+
+    @staticmethod
+    def tensor_hash(tensor):
+        """
+        Returns: sha1 of the dtype, shape and bytes of a tensor. The tensor is copied to the CPU if needed.
+        """
+        import torch
+
+        tensor = tensor.detach().to("cpu").contiguous()
+        digest = hashlib.sha1(f"{tensor.dtype}:{tuple(tensor.shape)}:".encode())
+        digest.update(tensor.reshape(-1).view(torch.uint8).numpy())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _own_storage(tensor):
+        """
+        Returns: the tensor, or a copy of it if it is a view of a larger storage, which torch.save would write
+            entirely.
+        """
+        try:
+            nbytes = tensor.untyped_storage().nbytes()
+        except AttributeError:  # untyped_storage was added in torch 2.0
+            return tensor.clone()
+        if tensor.storage_offset() or nbytes != tensor.numel() * tensor.element_size():
+            return tensor.clone()
+        return tensor
+
+    def _replace_tensors(self, item, blobs):
+        """
+        Writes the large tensors of item as blobs, and replaces them with references.
+        """
+        import torch
+
+        if isinstance(item, torch.Tensor) and item.numel() * item.element_size() >= self.dedup_min_bytes:
+            # One copy in CPU memory (none for CPU tensors, such as snapshots) is hashed, and written if needed.
+            tensor = item.detach().to("cpu").contiguous()
+            key = self.tensor_hash(tensor)
+            self.write_blob(key, lambda file: torch.save(self._own_storage(tensor), file))
+            blobs.add(key)
+            return {BLOB_MARKER: key}
+        if isinstance(item, dict):
+            return type(item)((key, self._replace_tensors(value, blobs)) for key, value in item.items())
+        if isinstance(item, (list, tuple)):
+            return type(item)(self._replace_tensors(value, blobs) for value in item)
+        return item
+
+    def _restore_tensors(self, item):
+        """
+        Replaces the blob references of item with the saved tensors.
+        """
+        if isinstance(item, dict):
+            if set(item.keys()) == {BLOB_MARKER}:
+                return self._load_shard(self.blob_path / item[BLOB_MARKER])
+            return type(item)((key, self._restore_tensors(value)) for key, value in item.items())
+        if isinstance(item, (list, tuple)):
+            return type(item)(self._restore_tensors(value) for value in item)
+        return item
+
+    def write(self, content, file, **kwargs):
+        import torch
+
+        if not self.dedup:
+            torch.save(content, file)
+            return None
+        blobs = set()
+        torch.save(self._replace_tensors(content, blobs), file)
+        return blobs
+
+    def _load_shard(self, shard_file):
+        """
+        Loads a shard memory-mapped on CPU. `load_state_dict` then copies the tensors to the models.
+        Compressed shards cannot be memory-mapped: they are decompressed in memory.
+        """
+        import torch
+
+        if detect_codec(shard_file).magic is not None:
+            return self._load_file(shard_file, map_location="cpu")
+        try:
+            return torch.load(shard_file, map_location="cpu", mmap=True)
+        except TypeError:  # mmap was added in torch 2.1
+            return torch.load(shard_file, map_location="cpu")
+
+    def _load_file(self, filename, **kwargs):
+        import torch
+
+        if detect_codec(filename).magic is None:
+            return torch.load(filename, **kwargs)
+        # torch.load needs a seekable file.
+        with self.open_file(filename) as stream:
+            return torch.load(io.BytesIO(stream.read()), **kwargs)
 
     def load(self, models, version="best", **kwargs):
         """
         Load the artifact
         Args:
             models: dict of models. Keys should be the same as the saved keys of the artifacts.
+                For sharded artifacts, only the files of these keys are read, and they are memory-mapped.
             version: version to load
 
         Returns: dicts of loaded models
@@ -184,8 +989,13 @@ class TorchModelArtifact(Artifact):
         """
         import torch
 
-        file_name = self.path / self.name.format(version=version)
-        loaded_dicts = torch.load(file_name)
+        if os.path.isdir(self.file_name(version)):
+            keys = models.keys() if type(models) is dict else None
+            loaded_dicts = {key: self._load_shard(shard_file)
+                            for key, shard_file in self.shard_files(version, keys).items()}
+        else:
+            loaded_dicts = self._load_file(self.file_name(version))
+        loaded_dicts = self._restore_tensors(loaded_dicts)
         is_not_dict = type(models) is not dict and type(loaded_dicts) is not dict
         if is_not_dict:
             models = dict(default=models)
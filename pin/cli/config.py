@@ -2,10 +2,8 @@ import os
 from pathlib import Path
 
 import click
-from ruamel.yaml import YAML
 
 from pin.cli.utils import find_root_folder
-from pin.config import configs_in, import_matches
 
 
 def make_dict_from_dot_path(dot_path, value):
@@ -34,54 +32,160 @@ def config_group():
     pass
 
 
+def set_dotted_key_in_dict(dotted_key, d, value):
+    """
+    Sets a nested key in a dict, keeping the other entries of the intermediate dicts.
+    """
+    key = dotted_key.pop(0)
+    if len(dotted_key) and key in d and isinstance(d[key], dict):
+        set_dotted_key_in_dict(dotted_key, d[key], value)
+    else:
+        d[key] = make_dict_from_dot_path(dotted_key, value)
+
+
 @config_group.command("init", help="Initialize empty configurations.")
 @click.option("--yes", "-y", is_flag=True, default=False)
+@click.option("--check", is_flag=True, default=False,
+              help="Only list the missing files and keys. Exits with an error if some are missing.")
+@click.option("--changed", is_flag=True, default=False,
+              help="Only analyse the configuration files changed since the last complete run with --changed.")
 @click.option("-v", "values", multiple=True)
-def init_config(yes, values):
+def init_config(yes, check, changed, values):
     """
     Analysis missing configuration values, creates and fills
-     missing configuration files
+     missing configuration files.
+    All the missing files and keys are first collected, then each configuration file
+    is loaded and written at most once.
+    With --changed, files are skipped if neither they nor the files they import changed since the last run.
     """
+    from ruamel.yaml import YAML
+    from pin.config import SNAPSHOT_DIR, ConfigIndex, configs_in, file_stamp, import_matches, parse_import
+
     values = list(values)
     yaml = YAML()
     yaml.preserve_quotes = True
 
     base_path = find_root_folder(Path(os.getcwd()))
     len_conf_base = len(str(base_path / 'config')) + 1
-    for config_path, config in configs_in(base_path / 'config'):
-        # source_file_name = config_path[len_conf_base:]
+    index = ConfigIndex(str(base_path / 'config' / SNAPSHOT_DIR / 'init_index.json')) if changed else None
+
+    contents = dict()  # import path -> yaml content, None if the file is missing
+    created = set()
+    missing_keys = []  # (import path, import var), in order of appearance
+    analysed = dict()  # config path -> (stamp, imports)
+
+    def is_unchanged(config_path, stamp):
+        # The index keeps the stamps of the imported files: a file is analysed again if a key is removed from them.
+        import_stamps = index.get(config_path, stamp)
+        return import_stamps is not None and all(
+            import_stamp is not None and file_stamp(import_path) == tuple(import_stamp)
+            for import_path, import_stamp in import_stamps.items())
+
+    for config_path in configs_in(base_path / 'config', read=False):
+        stamp = file_stamp(config_path)
+        if index is not None and is_unchanged(config_path, stamp):
+            continue
+        with open(config_path, 'r') as config_file:
+            config = config_file.read()
+        analysed[config_path] = (stamp, [])
         config_root_path = Path('/'.join(config_path.split('/')[:-1]))
         for match in import_matches(config):
-            import_path = config_root_path / (match.group(1).strip().replace('.', '/') + ".yaml")
-            import_var = []
-            if match.group(3) is not None:
-                import_var = match.group(3).strip().split('.')
+            source, import_var = parse_import(match)
+            import_path = config_root_path / source
+            analysed[config_path][1].append((import_path, tuple(import_var)))
             target_file_name = str(import_path)[len_conf_base:]
-            # Look if file does not exists. And ask to create it.
-            if not import_path.exists():
-                if yes or click.confirm(f"The configuration file `{target_file_name}` "
-                                 "does not exist. Do you want to create it?",
-                                 default=True):
-                    with open(import_path, 'w') as f:
-                        f.write('')
-            # Ask to add missing configuration keys.
-            if import_path.exists() and len(import_var):
-                with open(import_path, 'r') as yaml_file:
-                    yaml_content = yaml.load(yaml_file)
-
-                if yaml_content is None:
-                    yaml_content = dict()
-
-                if not is_dotted_key_in_dict(import_var, yaml_content):
-                    if len(values):
-                        prompted_val = values.pop(0)
-                    else:
-                        prompted_val = click.prompt(f"The configuration file `{target_file_name}` "
-                                                    f"is missing the key `{match.group(3).strip()}`. "
-                                                    "Fill it with")
-                    # TODO: We assume that each config file is a dict yaml.
-                    #  To be adapted for list configs.
-                    sub_dict = make_dict_from_dot_path(import_var, prompted_val)
-                    yaml_content.update(sub_dict)
-                    with open(import_path, 'w') as f:
-                        yaml.dump(yaml_content, f)
+            if import_path not in contents:
+                if import_path.exists():
+                    with open(import_path, 'r') as yaml_file:
+                        yaml_content = yaml.load(yaml_file)
+                    contents[import_path] = yaml_content if yaml_content is not None else dict()
+                elif check:
+                    click.echo(f"Missing configuration file `{target_file_name}`.")
+                    contents[import_path] = dict()
+                    created.add(import_path)
+                # Ask to create missing files.
+                elif yes or click.confirm(f"The configuration file `{target_file_name}` "
+                                          "does not exist. Do you want to create it?",
+                                          default=True):
+                    contents[import_path] = dict()
+                    created.add(import_path)
+                else:
+                    contents[import_path] = None
+            yaml_content = contents[import_path]
+            if (yaml_content is not None and len(import_var)
+                    and (import_path, tuple(import_var)) not in missing_keys
+                    and not is_dotted_key_in_dict(list(import_var), yaml_content)):
+                missing_keys.append((import_path, tuple(import_var)))
+
+    def save_index():
+        # Only files whose imports are all satisfied are skipped next time.
+        for config_path, (stamp, imports) in analysed.items():
+            if all(contents[import_path] is not None
+                   and not (check and (import_path in created or (import_path, import_var) in missing_keys))
+                   for import_path, import_var in imports):
+                index.update(config_path, stamp, {str(import_path): file_stamp(import_path)
+                                                  for import_path, _ in imports})
+        index.save()
+
+    if check:
+        for import_path, import_var in missing_keys:
+            click.echo(f"Missing key `{'.'.join(import_var)}` in `{str(import_path)[len_conf_base:]}`.")
+        if index is not None:
+            save_index()
+        if len(created) or len(missing_keys):
+            raise click.ClickException(f"{len(created)} missing configuration file(s) "
+                                       f"and {len(missing_keys)} missing key(s).")
+        return
+
+    # Ask to add missing configuration keys.
+    modified = set(created)
+    for import_path, import_var in missing_keys:
+        if len(values):
+            prompted_val = values.pop(0)
+        else:
+            prompted_val = click.prompt(f"The configuration file `{str(import_path)[len_conf_base:]}` "
+                                        f"is missing the key `{'.'.join(import_var)}`. "
+                                        "Fill it with")
+        # TODO: We assume that each config file is a dict yaml.
+        #  To be adapted for list configs.
+        set_dotted_key_in_dict(list(import_var), contents[import_path], prompted_val)
+        modified.add(import_path)
+
+    for import_path in contents.keys():
+        if import_path in modified:
+            with open(import_path, 'w') as f:
+                if len(contents[import_path]):
+                    yaml.dump(contents[import_path], f)
+
+    if index is not None:
+        # Written files changed: they are analysed again next time.
+        save_index()
+
+
+@config_group.command("compile", help="Compile configurations into snapshots for faster loading.")
+@click.argument("names", nargs=-1)
+def compile_configs(names):
+    """
+    Resolves configurations and saves them in snapshots. `load_config` then uses a snapshot as long as
+    its source files are unchanged, and rebuilds it otherwise.
+    By default, compiles all configuration files at the root of the config folder.
+    """
+    from pin.config import compile_config, snapshot_path
+
+    base_path = find_root_folder(Path(os.getcwd()))
+    if not base_path:
+        raise click.ClickException("Could not find the project root folder.")
+    config_path = base_path / 'config'
+    if not len(names):
+        names = sorted(file for file in os.listdir(config_path) if file.endswith('.yaml'))
+    failed = []
+    for name in names:
+        try:
+            compile_config(str(config_path / name))
+        except (OSError, ValueError) as error:
+            click.echo(f"Could not compile `{name}`: {error}", err=True)
+            failed.append(name)
+        else:
+            click.echo(f"Compiled `{name}` into {os.path.relpath(snapshot_path(str(config_path / name)), base_path)}.")
+    if len(failed):
+        raise click.ClickException(f"{len(failed)} configuration(s) could not be compiled.")
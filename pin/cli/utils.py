@@ -4,8 +4,6 @@ from pathlib import Path
 
 import click
 
-from pin.sacred import get_sacred_conf
-
 
 def copytree(src, dst, symlinks=False, ignore=None):
     for item in os.listdir(src):
@@ -46,6 +44,8 @@ def find_root_folder(base_path):
 
 
 def find_and_get_sacred_conf(base_path):
+    from pin.sacred import get_sacred_conf
+
     root_folder = find_root_folder(base_path)
     if root_folder:
         return get_sacred_conf(root_folder)
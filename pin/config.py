@@ -1,6 +1,13 @@
+import copy
+import functools
+import hashlib
+import json
 import os
+import pickle
 import re
-from pathlib import Path
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 
 from omegaconf import OmegaConf, DictConfig, ListConfig
@@ -8,20 +15,190 @@ from omegaconf import OmegaConf, DictConfig, ListConfig
 config_type = Union[DictConfig, ListConfig]
 
 
-def load_config(path, imports=True, to_container=False):
+def file_stamp(path):
     """
-    Load configuration.
+    Cheap fingerprint of a file used to know if it changed.
+    Args:
+        path: path of the file
+    Returns: (mtime in ns, size) or None if the file does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ImportCache:
+    """
+    Process-wide LRU cache of resolved configuration files.
+    Entries are keyed by absolute path and stay valid as long as the file and all the files
+    it imports keep the same mtime and size.
+    """
+
+    def __init__(self, maxsize=128):
+        """
+        Args:
+            maxsize: maximum number of resolved files kept in memory. Defaults to 128.
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, path):
+        """
+        Args:
+            path: path of the configuration file
+        Returns: the resolved configuration and the stamps of its dependencies, or None if
+            not in the cache or outdated.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None:
+            return None
+        # Files are checked outside of the lock so that threads do not wait on each other's stat calls.
+        conf, stamps = entry
+        is_outdated = any(file_stamp(dependency) != stamp for dependency, stamp in stamps.items())
+        with self._lock:
+            if self._entries.get(path) is entry:
+                if is_outdated:
+                    del self._entries[path]
+                else:
+                    self._entries.move_to_end(path)
+        if is_outdated:
+            return None
+        return entry
+
+    def put(self, path, conf, stamps):
+        """
+        Args:
+            path: path of the configuration file
+            conf: resolved configuration
+            stamps: dict of the stamps (see `file_stamp`) of the file and of all its imports.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            self._entries[path] = (conf, stamps)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path=None):
+        """
+        Removes entries from the cache.
+        Args:
+            path: if given, only removes the entries of this file and of the files importing it.
+                Otherwise, clears the whole cache.
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+            path = os.path.abspath(path)
+            for key in [key for key, (_, stamps) in self._entries.items() if path in stamps]:
+                del self._entries[key]
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+import_cache = ImportCache()
+# Files loaded with lazy=True, their imports replaced by `pin_import` interpolations.
+lazy_import_cache = ImportCache()
+
+
+def invalidate_import_cache(path=None):
+    """
+    Invalidates the import cache.
+    Args:
+        path: if given, only invalidates this file (and the files importing it). Otherwise, clears the cache.
+    """
+    import_cache.invalidate(path)
+    lazy_import_cache.invalidate(path)
+    _lazy_resolver_confs.clear()
+
+
+def load_resolved(path, stamps=None):
+    """
+    Loads a configuration file and resolves its imports, using the import cache.
     Args:
         path: path to the configuration
+        stamps: if given, dict updated with the stamps of the file and of all its imports.
+    Returns: the resolved configuration. It is shared with the cache and must not be modified.
+    """
+    cached = import_cache.get(path)
+    if cached is None:
+        file_stamps = {os.path.abspath(path): file_stamp(path)}
+        conf = OmegaConf.load(path)
+        resolve_imports(path, conf, file_stamps)
+        import_cache.put(path, conf, file_stamps)
+    else:
+        conf, file_stamps = cached
+    if stamps is not None:
+        stamps.update(file_stamps)
+    return conf
+
+
+def load_configs(paths, max_workers=None, **kwargs):
+    """
+    Loads several configurations concurrently in a thread pool. Reading files is mostly
+    waiting on the file system, so the latencies of the files and of their imports overlap.
+    Args:
+        paths: list of paths to the configurations
+        max_workers: number of threads. Defaults to one per configuration (with a maximum of 16).
+        **kwargs: other arguments of `load_config`.
+    Returns: list of the configurations, in the same order as paths.
+    """
+    paths = list(paths)
+    if len(paths) <= 1:
+        return [load_config(path, **kwargs) for path in paths]
+    max_workers = min(len(paths), 16) if max_workers is None else max_workers
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda path: load_config(path, **kwargs), paths))
+
+
+def load_config(path, imports=True, to_container=False, lazy=False, snapshot=True):
+    """
+    Load configuration.
+    Args:
+        path: path to the configuration. If a list of paths is given, they are loaded with
+          `load_configs` and a list of configurations is returned.
         imports: if imports should be resolved. Defaults to True.
         to_container: if True will return a dict or list according to the config type. Otherwise
           will return the omegaconf object.
+        lazy: if True, imports are only resolved (and imported files opened) when the value is read.
+          Defaults to False.
+        snapshot: if True and the configuration has been compiled (see `compile_config`), the snapshot
+          is used instead. It is rebuilt if outdated. Defaults to True.
 
     Returns: OmegaConf
     """
-    conf = OmegaConf.load(path)
-    if imports:
-        resolve_imports(path, conf)
+    if isinstance(path, (list, tuple)):
+        return load_configs(path, imports=imports, to_container=to_container, lazy=lazy, snapshot=snapshot)
+
+    if imports and not lazy and snapshot and os.path.isfile(snapshot_path(path)):
+        container = load_snapshot(path)
+        if container is None:
+            try:
+                container = compile_config(path)
+            except OSError:  # Read-only config folder
+                return load_config(path, to_container=to_container, snapshot=False)
+        conf = OmegaConf.create(container)
+        # The interpolations of the snapshot are resolved when read.
+        return OmegaConf.to_container(conf, resolve=True) if to_container else conf
+
+    if not imports:
+        conf = OmegaConf.load(path)
+    elif lazy:
+        conf = load_lazy(path)
+    else:
+        conf = load_resolved(path)
+        if not to_container:
+            conf = copy.deepcopy(conf)
     if to_container:
         return OmegaConf.to_container(conf, resolve=True)
     return conf
@@ -44,12 +221,30 @@ def get_nested_key_in_config(conf, keys):
 
 
 def update_dict_from_nested_key(config, nested_key, value):
+    """
+    Sets a nested key in a dict. Missing intermediate dicts are created.
+    Only the dicts along the nested key are copied, so config is not modified.
+    Args:
+        config (dict): configuration
+        nested_key (list): nested key. For instance ['key1', 'key2'] to set config['key1']['key2'].
+        value: the new value
+    Returns: the updated copy of config.
+    """
     if not len(nested_key):
-        return
-    if len(nested_key) == 1:
-        config[nested_key[0]] = value
-    key = nested_key.pop(0)
-    update_argv_from_arguments(config[key], nested_key, value)
+        return value
+    config = dict(config) if isinstance(config, dict) else dict()
+    key = nested_key[0]
+    config[key] = update_dict_from_nested_key(config.get(key), nested_key[1:], value)
+    return config
+
+
+# Items of the form @{path:var} where path can be words, ., %, _, \, -.
+_allowed_characters = r"[\w\.%_ \\,-]"
+IMPORT_REGEX = re.compile(r"@{(" + _allowed_characters + r"+)(:(" + _allowed_characters + r"*?))?}")
+
+# An import in a config str. source is the imported file (with the .yaml extension), relative to the
+# importing file. var is the imported nested key as a tuple.
+ImportReference = namedtuple("ImportReference", ["token", "source", "var"])
 
 
 def import_matches(conf):
@@ -59,114 +254,598 @@ def import_matches(conf):
         conf (str):
     Yields: regex matches
     """
-    # Get items of the form @{path:var} where path can be words, ., %, _, \, -.
-    allowed_characters = r"[\w\.%_ \\,-]"
-    regex = r"@{(" + allowed_characters + r"+)(:(" + allowed_characters + r"*?))?}"
-    for match in re.finditer(regex, conf):
-        yield match
+    return IMPORT_REGEX.finditer(conf)
 
 
-def _update_values(source_path, path, item, conf: config_type, sub_conf):
+def parse_import(match):
     """
-    Update a sub_conf str if contains an auto import line
     Args:
-        source_path: source path
-        path:
-        item: item (or index)
-        conf: original configuration
-        sub_conf: sub configuration
-    """
-    if isinstance(sub_conf, str):
-        for match in import_matches(sub_conf):
-            var = []
-            if match.group(1) is not None and match.group(3) is None:
-                source = match.group(1).strip()
-            elif match.group(3) is not None:
-                source = match.group(1).strip()
-                var = match.group(3).strip().split('.')
-            else:
-                raise ValueError(f"{sub_conf} has a syntax error.")
-            source = source.replace('.', '/') + '.yaml'
-            imported = OmegaConf.load(str(source_path / source))
-            resolve_imports(str(source_path / source), imported)
-            try:
-                content = get_nested_key_in_config(imported, var)
-            except ValueError:  # More specific error message with path of the config file.
-                raise ValueError(f"{'.'.join(var)} is not in {source}.")
-            # Recursively import
-            if isinstance(content, str):
-                # We just replace part of the string of the match
-                conf[item] = conf[item].replace(match.group(0), content.strip())
-            else:
-                conf[item] = content
-    elif isinstance(sub_conf, (DictConfig, ListConfig)):
-        resolve_imports(path, sub_conf)
+        match: a match given by `import_matches`
+    Returns: the imported file relative to the importing file (with the .yaml extension) and
+        the imported nested key as a list.
+    """
+    source = match.group(1).strip().replace('.', '/') + '.yaml'
+    var = []
+    if match.group(3) is not None:
+        var = match.group(3).strip().split('.')
+    return source, var
+
 
+@functools.lru_cache(maxsize=4096)
+def _import_reference(source, key_group, var):
+    var = tuple(var.strip().split('.')) if var is not None else ()
+    token = "@{" + source + (key_group if key_group is not None else "") + "}"
+    return ImportReference(token, source.strip().replace('.', '/') + '.yaml', var)
 
-def resolve_imports(path, conf: config_type):
+
+def split_imports(value):
     """
-    Replaces inplace auto imports in the conf
+    Splits a config str in one pass.
+    Args:
+        value (str):
+    Returns: list of segments: str for literal parts and ImportReference for the imports.
+    """
+    if "@{" not in value:
+        return [value]
+    # The split alternates literal parts and the 3 groups of the regex.
+    parts = IMPORT_REGEX.split(value)
+    segments = []
+    for k in range(0, len(parts) - 1, 4):
+        if len(parts[k]):
+            segments.append(parts[k])
+        segments.append(_import_reference(parts[k + 1], parts[k + 2], parts[k + 3]))
+    if len(parts[-1]) or not len(segments):
+        segments.append(parts[-1])
+    return segments
+
+
+def has_imports(segments):
+    return len(segments) > 1 or isinstance(segments[0], ImportReference)
+
+
+def join_imports(segments, get_content):
+    """
+    Assembles the value of split config str.
+    Args:
+        segments: segments given by `split_imports`
+        get_content: function returning the imported content of an ImportReference.
+    Returns: the joined str, or the imported content if it is not a str.
+    """
+    parts = []
+    for segment in segments:
+        if isinstance(segment, ImportReference):
+            content = get_content(segment)
+            if not isinstance(content, str):
+                return content
+            segment = content.strip()
+        parts.append(segment)
+    return "".join(parts)
+
+
+class ImportCycleError(ValueError):
+    """
+    Raised when configuration values import each other in a loop.
+    """
+
+
+def get_imported_content(imported, reference):
+    """
+    Args:
+        imported: the resolved imported configuration
+        reference: ImportReference
+    Returns: the content of the imported configuration at the key of the reference.
+    """
+    try:
+        return get_nested_key_in_config(imported, list(reference.var))
+    except ValueError:  # More specific error message with path of the config file.
+        raise ValueError(f"{'.'.join(reference.var)} is not in {reference.source}.")
+
+
+def config_leaves(conf, prefix=()):
+    """
+    Yields all the string values of a configuration without resolving them.
     Args:
-        path:
         conf: OmegaConf
+        prefix: keys of conf in the root configuration.
+    Yields: (nested key as a tuple, value)
     """
-    source_path = Path('/'.join(path.split('/')[:-1]))
-    original_conf = conf.copy()
     if isinstance(conf, DictConfig):
-        for item in resolve_order(original_conf):
-            first_index = item.split('.')[0]
-            _update_values(source_path, path, first_index, conf, conf[first_index])
+        items = conf.items(resolve=False)
     elif isinstance(conf, ListConfig):
-        for item, sub_conf in enumerate(original_conf):
-            _update_values(source_path, path, item, conf, sub_conf)
-
-
-def get_keys_to_resolve(conf, prefix=None):
-    if prefix is None:
-        prefix = []
-    items = []
-    for item, sub_conf in conf.items():
-        new_prefix = prefix + [item]
-        if isinstance(sub_conf, DictConfig):
-            items.extend(get_keys_to_resolve(sub_conf, new_prefix))
+        items = enumerate(conf)
+    else:
+        return
+    for item, sub_conf in items:
+        if isinstance(sub_conf, str):
+            yield prefix + (item,), sub_conf
         else:
-            items.append(".".join(new_prefix))
-    return items
+            yield from config_leaves(sub_conf, prefix + (item,))
+
+
+def _set_nested_value(conf, keys, value):
+    for key in keys[:-1]:
+        conf = conf[key]
+    conf[keys[-1]] = value
 
 
-def resolve_order(conf):
+class ImportGraph:
+    """
+    Dependency graph of the imports of a configuration tree.
+    Nodes are the string values containing imports, identified by (file path, nested key). A node depends
+    on the nodes of the imported file that are above or below the imported key.
+    """
+    _visiting = 1
+    _done = 2
+
+    def __init__(self):
+        self.root = None
+        self.files = dict()  # path -> conf
+        self.cached = dict()  # path -> stamps, for files given already resolved by the import cache
+        self.nodes = dict()  # (path, keys) -> segments, with absolute imported paths as sources
+        self.node_keys = dict()  # path -> {str keys: keys}
+        self.node_prefixes = dict()  # path -> {str prefix: list of keys of nodes below the prefix}
+        self.imported_files = dict()  # path -> set of imported paths
+        self.stamps = dict()
+
+    def add_file(self, path, conf=None):
+        """
+        Adds a configuration file and, recursively, all the files it imports.
+        Args:
+            path: path to the configuration
+            conf: content of the configuration. If None, it is loaded from path.
+        """
+        to_scan = [(os.path.abspath(path), conf)]
+        if self.root is None:
+            self.root = to_scan[0][0]
+        while len(to_scan):
+            path, conf = to_scan.pop()
+            if path in self.files:
+                continue
+            if conf is None:
+                cached = import_cache.get(path)
+                if cached is not None:
+                    self.files[path] = cached[0]
+                    self.stamps.update(cached[1])
+                    self.cached[path] = cached[1]
+                    continue
+                self.stamps[path] = file_stamp(path)
+                conf = OmegaConf.load(path)
+            self.files[path] = conf
+            self.imported_files[path] = set()
+            self.node_keys[path] = dict()
+            self.node_prefixes[path] = dict()
+            source_path = os.path.dirname(path)
+            for keys, value in config_leaves(conf):
+                segments = split_imports(value)
+                if not has_imports(segments):
+                    continue
+                for k, segment in enumerate(segments):
+                    if isinstance(segment, ImportReference):
+                        imported_path = os.path.abspath(os.path.join(source_path, segment.source))
+                        segments[k] = segment._replace(source=imported_path)
+                        self.imported_files[path].add(imported_path)
+                        to_scan.append((imported_path, None))
+                self._add_node(path, keys, segments)
+
+    def _add_node(self, path, keys, segments):
+        self.nodes[(path, keys)] = segments
+        str_keys = tuple(str(key) for key in keys)
+        self.node_keys[path][str_keys] = keys
+        for k in range(len(str_keys) + 1):
+            self.node_prefixes[path].setdefault(str_keys[:k], []).append(keys)
+
+    def dependencies(self, node):
+        """
+        Args:
+            node: (path, keys)
+        Yields: the nodes that must be resolved before node.
+        """
+        for reference in self.nodes[node]:
+            if not isinstance(reference, ImportReference):
+                continue
+            imported_path, var = reference.source, reference.var
+            if imported_path in self.cached:
+                continue
+            # Values above the imported key
+            for k in range(len(var)):
+                if var[:k] in self.node_keys[imported_path]:
+                    yield imported_path, self.node_keys[imported_path][var[:k]]
+            # The imported key itself and the values below it
+            for keys in self.node_prefixes[imported_path].get(var, []):
+                yield imported_path, keys
+
+    def node_name(self, node):
+        path, keys = node
+        return f"{os.path.relpath(path, os.path.dirname(self.root))}:{'.'.join(map(str, keys))}"
+
+    def resolve(self):
+        """
+        Resolves every node once, in topological order, and puts the resolved files in the import cache.
+        """
+        state = dict()
+        for node in self.nodes.keys():
+            self._visit(node, state, [])
+        self._cache_files()
+
+    def _visit(self, node, state, chain):
+        if state.get(node) == self._done:
+            return
+        if state.get(node) == self._visiting:
+            cycle = chain[chain.index(node):] + [node]
+            raise ImportCycleError("Import cycle detected: " + " -> ".join(map(self.node_name, cycle)))
+        state[node] = self._visiting
+        chain.append(node)
+        for dependency in self.dependencies(node):
+            self._visit(dependency, state, chain)
+        chain.pop()
+        self._resolve_node(node)
+        state[node] = self._done
+
+    def _resolve_node(self, node):
+        path, keys = node
+
+        def get_content(reference):
+            source = os.path.relpath(reference.source, os.path.dirname(path))
+            return get_imported_content(self.files[reference.source], reference._replace(source=source))
+
+        _set_nested_value(self.files[path], keys, join_imports(self.nodes[node], get_content))
+
+    def _cache_files(self):
+        for path in self.files.keys():
+            if path == self.root or path in self.cached:
+                continue
+            # The root conf may not be the one of the disk. Files depending on it are not cached.
+            dependencies = self._reachable_files(path)
+            if self.root not in dependencies:
+                import_cache.put(path, self.files[path], {dependency: self.stamps[dependency]
+                                                          for dependency in dependencies})
+
+    def _reachable_files(self, path):
+        reachable = {path}
+        to_visit = [path]
+        while len(to_visit):
+            current = to_visit.pop()
+            if current in self.cached:
+                reachable.update(self.cached[current].keys())
+                continue
+            for imported_path in self.imported_files[current] - reachable:
+                reachable.add(imported_path)
+                to_visit.append(imported_path)
+        return reachable
+
+
+def resolve_imports(path, conf: config_type, stamps=None):
+    """
+    Replaces inplace auto imports in the conf.
+    All the imports of the configuration tree are first collected in an `ImportGraph`, then each
+    imported value is resolved once in topological order.
+    Args:
+        path:
+        conf: OmegaConf
+        stamps: if given, dict updated with the stamps of the imported files.
+
+    Raises: ImportCycleError if some values import each other.
+    """
+    graph = ImportGraph()
+    graph.add_file(path, conf)
+    graph.resolve()
+    if stamps is not None:
+        stamps.update(graph.stamps)
+
+
+# Copies of the lazily loaded files read by the `pin_import` resolver, so that reading several keys of a file
+# does not copy it each time: path -> (cached conf, copy, files whose imports are cached in the copy).
+_lazy_resolver_confs = dict()
+# Dependencies of the `pin_import` resolutions in progress in the thread.
+_lazy_resolutions = threading.local()
+_lazy_directories = []  # directories of the lazily loaded files, referred to by index in interpolations.
+_lazy_directory_indices = dict()
+_lazy_directories_lock = threading.Lock()
+
+
+def _lazy_directory_index(directory):
+    with _lazy_directories_lock:
+        if directory not in _lazy_directory_indices:
+            _lazy_directory_indices[directory] = len(_lazy_directories)
+            _lazy_directories.append(directory)
+        return _lazy_directory_indices[directory]
+
+
+def _lazy_interpolations(directory_index, value):
+    """
+    Replaces the imports of a str by `pin_import` interpolations.
+    """
+    new_value = []
+    for segment in split_imports(value):
+        if isinstance(segment, ImportReference):
+            args = [str(directory_index), segment.source[:-len(".yaml")].replace('/', '.'), ".".join(segment.var)]
+            segment = "${pin_import:" + ",".join(arg.replace(",", "\\,") for arg in args) + "}"
+        new_value.append(segment)
+    return "".join(new_value)
+
+
+def _load_lazy_cached(path):
+    """
+    Returns: the lazily loaded configuration shared by the cache. It must not be modified.
+    """
+    cached = lazy_import_cache.get(path)
+    if cached is None:
+        stamps = {os.path.abspath(path): file_stamp(path)}
+        conf = OmegaConf.load(path)
+        directory_index = _lazy_directory_index(os.path.dirname(os.path.abspath(path)))
+        for keys, value in config_leaves(conf):
+            new_value = _lazy_interpolations(directory_index, value)
+            if new_value != value:
+                _set_nested_value(conf, keys, new_value)
+        lazy_import_cache.put(path, conf, stamps)
+        return conf
+    return cached[0]
+
+
+def load_lazy(path):
+    """
+    Loads a configuration whose imports are resolved when read.
+    Args:
+        path: path to the configuration
+    Returns: OmegaConf
+    """
+    # The copy has its own interpolation cache.
+    return copy.deepcopy(_load_lazy_cached(path))
+
+
+def _resolve_lazy_import(directory_index, source, var=""):
+    """
+    OmegaConf resolver of the `pin_import` interpolations used by the lazy loading.
+    """
+    path = os.path.join(_lazy_directories[int(directory_index)], source.replace('.', '/') + '.yaml')
+    var = var.split('.') if len(var) else []
+    conf = _load_lazy_cached(path)
+    key = os.path.abspath(path)
+    entry = _lazy_resolver_confs.get(key)
+    # The copy caches the imports it resolved: it is renewed if one of the imported files changed.
+    if (entry is None or entry[0] is not conf
+            or any(_load_lazy_cached(dependency) is not dependency_conf
+                   for dependency, dependency_conf in list(entry[2].items()))):
+        entry = (conf, copy.deepcopy(conf), dict())
+        _lazy_resolver_confs.pop(key, None)
+        _lazy_resolver_confs[key] = entry
+        if len(_lazy_resolver_confs) > lazy_import_cache.maxsize:
+            _lazy_resolver_confs.pop(next(iter(_lazy_resolver_confs)), None)
+    if not hasattr(_lazy_resolutions, "stack"):
+        _lazy_resolutions.stack = []
+    for dependencies in _lazy_resolutions.stack:
+        dependencies[key] = conf
+        dependencies.update(entry[2])
+    _lazy_resolutions.stack.append(entry[2])
+    try:
+        content = get_nested_key_in_config(entry[1], var)
+    except ValueError:  # More specific error message with path of the config file.
+        raise ValueError(f"{'.'.join(var)} is not in {source}.")
+    finally:
+        _lazy_resolutions.stack.pop()
+    if isinstance(content, str):
+        return content.strip()
+    if isinstance(content, (DictConfig, ListConfig)):
+        # Only the imported subtree is copied, so that each load can modify it.
+        return copy.deepcopy(content)
+    return content
+
+
+if OmegaConf.get_resolver("pin_import") is None:
+    OmegaConf.register_resolver("pin_import", _resolve_lazy_import)
+
+
+SNAPSHOT_DIR = "__pincache__"
+SNAPSHOT_VERSION = 2
+
+
+def snapshot_path(path):
     """
-    Yields the order to resolve the imports
     Args:
-        conf:
+        path: path to the configuration
+    Returns: path of the compiled snapshot of the configuration.
+    """
+    directory, file_name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, SNAPSHOT_DIR, file_name + ".pkl")
+
+
+def file_hash(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def compile_config(path):
+    """
+    Resolves the imports of a configuration and saves it in a snapshot, with a manifest of the source files.
+    `load_config` then reads the snapshot as long as the source files are unchanged. OmegaConf interpolations
+    (such as `${env:VAR}`) are kept, as the manifest cannot tell when they change.
+    Args:
+        path: path to the configuration
+    Returns: the configuration with resolved imports as a container.
+    """
+    stamps = dict()
+    conf = load_resolved(path, stamps)
+    directory = os.path.dirname(os.path.abspath(path))
+    sources = {os.path.relpath(source, directory): (stamp, file_hash(source))
+               for source, stamp in stamps.items()}
+    container = OmegaConf.to_container(conf, resolve=False)
+    target = snapshot_path(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_target = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_target, 'wb') as file:
+        pickle.dump({"version": SNAPSHOT_VERSION, "sources": sources, "config": container}, file,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_target, target)
+    return container
+
+
+def load_snapshot(path):
+    """
+    Args:
+        path: path to the configuration
+    Returns: the compiled configuration as a container, or None if there is no snapshot or one of its
+        source files changed.
+    """
+    try:
+        with open(snapshot_path(path), 'rb') as file:
+            snapshot = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    directory = os.path.dirname(os.path.abspath(path))
+    for source, (stamp, digest) in snapshot["sources"].items():
+        source = os.path.join(directory, source)
+        # The hash is only computed when the file has been touched.
+        current_stamp = file_stamp(source)
+        if current_stamp is None:
+            return None
+        if current_stamp != stamp and file_hash(source) != digest:
+            return None
+    return snapshot["config"]
+
+
+CONFIG_EXTENSIONS = ('.yaml', '.yml')
+
+
+class ConfigIndex:
+    """
+    Stamps (see `file_stamp`) of configuration files saved in a json file, to know which files
+    changed since the index was last saved. A JSON value can be kept with the stamp of each file (such as the
+    digests of the sources added by `pin.sacred.add_dir_sources`).
     """
-    keys = list(get_keys_to_resolve(conf))
-    return sorted(keys, key=lambda x: len(x.split('.')))
 
+    def __init__(self, path):
+        """
+        Args:
+            path: path of the json file. It does not need to exist.
+        """
+        self.path = path
+        try:
+            with open(path, 'r') as index_file:
+                self.entries = {file: (tuple(entry[:2]), entry[2] if len(entry) > 2 else None)
+                                for file, entry in json.load(index_file).items()}
+        except (OSError, ValueError):
+            self.entries = dict()
+        self.changed = False
 
-def configs_in(base_path):
+    def is_unchanged(self, path, stamp):
+        entry = self.entries.get(os.path.abspath(path))
+        return entry is not None and entry[0] == stamp
+
+    def get(self, path, stamp):
+        """
+        Returns: the value kept with the file, or None if the file changed.
+        """
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        return None
+
+    def update(self, path, stamp, value=None):
+        self.entries[os.path.abspath(path)] = (stamp, value)
+        self.changed = True
+
+    def save(self):
+        """
+        Saves the index if it changed. In a read-only folder, the index is not saved.
+        """
+        if not self.changed:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp_path, 'w') as index_file:
+                json.dump({file: [*stamp, value] for file, (stamp, value) in self.entries.items()}, index_file)
+            os.replace(tmp_path, self.path)
+        except OSError:  # Read-only folder
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.changed = False
+
+
+def configs_in(base_path, read=True):
     """
-    Yields all configurations in a given path (recursively).
+    Yields all configurations (.yaml and .yml files) in a given path (recursively), in alphabetical order.
+    Directories are scanned one at a time and files are only opened when they are yielded.
     Args:
         base_path:
-    Yields: configuration contents
+        read: if True, yields the path and the content of the files. Otherwise, only yields the paths
+            and the files are not opened. Defaults to True.
+    Yields: configuration paths and contents
     """
-    for dir_path, dir_names, file_names in sorted(os.walk(base_path), key=lambda x: x[0]):
-        for file in sorted(file_names):
-            path = os.path.join(dir_path, file)
-            with open(path, 'r') as config_file:
-                yield path, config_file.read()
+    directories = [str(base_path)]
+    while len(directories):
+        directory = directories.pop()
+        with os.scandir(directory) as scanned_entries:
+            entries = sorted(scanned_entries, key=lambda entry: entry.name)
+        sub_directories = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                if entry.name != SNAPSHOT_DIR:
+                    sub_directories.append(entry.path)
+            elif entry.name.endswith(CONFIG_EXTENSIONS) and entry.is_file():
+                if not read:
+                    yield entry.path
+                    continue
+                with open(entry.path, 'r') as config_file:
+                    yield entry.path, config_file.read()
+        directories.extend(reversed(sub_directories))
 
 
-def update_argv_from_arguments(args, conf, path):
-    source_path = Path('/'.join(path.split('/')[:-1]))
-    conf = conf.copy()
+# Sacred overrides of the form key.subkey=value, optionally quoted.
+OVERRIDE_REGEX = re.compile(r"^'?\s*([^'=\s][^'=]*?)\s*=\s*(.*?)'?$", re.DOTALL)
+
+
+def parse_overrides(args):
+    """
+    Parses the configuration overrides of a sacred command line.
+    Args:
+        args: command line arguments (sys.argv)
+    Returns: list of (index in args, dotted key, value)
+    """
     # Check that its a sacred valid cli input
-    if len(args) > 1 and args[1] == 'with':
-        for k, arg in enumerate(args[2:], 2):
-            for match in re.finditer(r"'?([^']*)\s?=\s?([^']*)'?", arg):
-                if match.group(1) is not None and match.group(2) is not None:
-                    item, value = match.group(1), match.group(2)
-                    update_dict_from_nested_key(conf, item.split('.'), value)
-                    _update_values(source_path, path, item, conf, value)
-                    args[k] = f"'{item}={conf[item]}'"
+    if len(args) < 2 or args[1] != 'with':
+        return []
+    overrides = []
+    for k, arg in enumerate(args[2:], 2):
+        match = OVERRIDE_REGEX.match(arg)
+        if match is not None:
+            overrides.append((k, match.group(1), match.group(2)))
+    return overrides
+
+
+def update_argv_from_arguments(args, conf, path):
+    """
+    Resolves the imports in the sacred overrides of the command line, for instance
+    `with 'key=@{vault:key}'`. The arguments are updated inplace.
+    All the arguments are parsed once, and each imported file is loaded once through the import cache.
+    Args:
+        args: command line arguments (sys.argv)
+        conf: the configuration loaded from path
+        path: path of the configuration. Imports are relative to it.
+    Returns: a copy of conf (as a container) with the overrides.
+    """
+    source_path = os.path.dirname(os.path.abspath(path))
+    if isinstance(conf, (DictConfig, ListConfig)):
+        conf = OmegaConf.to_container(conf)
+    overrides = [(k, item, split_imports(value)) for k, item, value in parse_overrides(args)]
+
+    imported_paths = sorted({os.path.join(source_path, segment.source)
+                             for _, _, segments in overrides for segment in segments
+                             if isinstance(segment, ImportReference)})
+    imported_files = dict(zip(imported_paths, load_configs(imported_paths)))
+
+    def get_content(reference):
+        return get_imported_content(imported_files[os.path.join(source_path, reference.source)], reference)
+
+    for k, item, segments in overrides:
+        value = join_imports(segments, get_content)
+        if isinstance(value, (DictConfig, ListConfig)):
+            value = OmegaConf.to_container(value)
+        conf = update_dict_from_nested_key(conf, item.split('.'), value)
+        args[k] = f"'{item}={value}'"
+    return conf
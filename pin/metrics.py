@@ -1,12 +1,411 @@
+import copy
+import math
+import multiprocessing
+import threading
+
 import numpy as np
 
 
+class QuantileSketch:
+    """
+    Streaming quantile sketch with a relative accuracy guarantee (DDSketch, Masson et al. 2019).
+    Values are counted in logarithmic bins: the quantiles have a relative error lower than relative_accuracy,
+    in memory bounded by max_bins. Sketches with the same relative_accuracy can be merged.
+    Non-finite values (nan, inf) are not in the quantiles, they are counted in non_finite_count.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # Counts of the bins of the positive values, and of the absolute value of the negative values.
+        self.positive = dict()
+        self.negative = dict()
+        self.zero_count = 0
+        self.count = 0
+        self.non_finite_count = 0
+
+    def _add_indices(self, bins, magnitudes):
+        indices = np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64)
+        for index, count in zip(*np.unique(indices, return_counts=True)):
+            bins[int(index)] = bins.get(int(index), 0) + int(count)
+        self._collapse(bins)
+
+    def _collapse(self, bins):
+        # The smallest magnitudes are merged in one bin, so the accuracy of the large quantiles is kept.
+        if len(bins) > self.max_bins:
+            indices = sorted(bins.keys())
+            collapsed = indices[:len(bins) - self.max_bins + 1]
+            bins[collapsed[-1]] = sum(bins.pop(index) for index in collapsed)
+
+    def add(self, value):
+        value = float(value)
+        if not math.isfinite(value):
+            self.non_finite_count += 1
+            return
+        self.count += 1
+        if value == 0:
+            self.zero_count += 1
+            return
+        bins = self.positive if value > 0 else self.negative
+        index = math.ceil(math.log(abs(value)) / self.log_gamma)
+        bins[index] = bins.get(index, 0) + 1
+        self._collapse(bins)
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        finite = np.isfinite(values)
+        if not finite.all():
+            self.non_finite_count += int(len(values) - np.count_nonzero(finite))
+            values = values[finite]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.zero_count += int(np.count_nonzero(values == 0))
+        if np.any(values > 0):
+            self._add_indices(self.positive, values[values > 0])
+        if np.any(values < 0):
+            self._add_indices(self.negative, -values[values < 0])
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged.")
+        for bins, other_bins in [(self.positive, other.positive), (self.negative, other.negative)]:
+            for index, count in other_bins.items():
+                bins[index] = bins.get(index, 0) + count
+            self._collapse(bins)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.non_finite_count += other.non_finite_count
+
+    def buckets(self):
+        """
+        Returns: list of (lower limit, upper limit, count) of the non empty bins, in increasing order.
+        """
+        buckets = [(-self.gamma ** index, -self.gamma ** (index - 1), self.negative[index])
+                   for index in sorted(self.negative.keys(), reverse=True)]
+        if self.zero_count:
+            buckets.append((0., 0., self.zero_count))
+        buckets.extend((self.gamma ** (index - 1), self.gamma ** index, self.positive[index])
+                       for index in sorted(self.positive.keys()))
+        return buckets
+
+    def quantile(self, q):
+        """
+        Args:
+            q: quantile in [0, 1]
+        Returns: estimation of the quantile, nan if no value was added.
+        """
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        for lower, upper, count in self.buckets():
+            seen += count
+            if seen > rank:
+                if lower == upper:
+                    return 0.
+                magnitude = 2 * abs(upper) * abs(lower) / (abs(upper) + abs(lower))
+                return magnitude if upper > 0 else -magnitude
+        return math.nan
+
+    def quantiles(self, qs):
+        return [self.quantile(q) for q in qs]
+
+
+class RunningStats:
+    """
+    Constant memory statistics of a stream of values: count, sum, mean and variance (Welford's algorithm),
+    min, max and last value. If a QuantileSketch is given, it is updated with the values.
+    """
+
+    def __init__(self, sketch=None):
+        self.sketch = sketch
+        self.count = 0
+        self.sum = 0.
+        self.mean = math.nan
+        self.m2 = 0.
+        self.min = math.inf
+        self.max = -math.inf
+        self.last = math.nan
+
+    def add(self, value):
+        value = float(value)
+        self.count += 1
+        self.sum += value
+        if self.count == 1:
+            self.mean = value
+        else:
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.last = value
+        if self.sketch is not None:
+            self.sketch.add(value)
+
+    def extend(self, values):
+        """
+        Adds several values, reduced with vectorized operations.
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        if not len(values):
+            return
+        chunk = RunningStats()
+        chunk.count = len(values)
+        chunk.sum = float(values.sum())
+        chunk.mean = chunk.sum / chunk.count
+        chunk.m2 = float(np.square(values - chunk.mean).sum())
+        chunk.min = float(values.min())
+        chunk.max = float(values.max())
+        chunk.last = float(values[-1])
+        self.merge(chunk)
+        if self.sketch is not None:
+            self.sketch.extend(values)
+
+    def merge(self, other):
+        """
+        Adds the values of another RunningStats (Chan et al. parallel algorithm).
+        """
+        if not other.count:
+            return
+        if not self.count:
+            self.mean = other.mean
+            self.m2 = other.m2
+        else:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.last = other.last
+        if self.sketch is not None and other.sketch is not None:
+            self.sketch.merge(other.sketch)
+
+    @property
+    def var(self):
+        return self.m2 / self.count if self.count else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.var)
+
+    def __len__(self):
+        return self.count
+
+
+class RingBuffer:
+    """
+    Keeps the last `capacity` values in a NumPy array.
+    """
+
+    def __init__(self, capacity, dtype=np.float64):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.position = 0
+        self.size = 0
+
+    def add(self, value):
+        self.data[self.position] = value
+        self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype).reshape(-1)[-self.capacity:]
+        end = self.position + len(values)
+        first = min(end, self.capacity) - self.position
+        self.data[self.position:self.position + first] = values[:first]
+        self.data[:len(values) - first] = values[first:]
+        self.position = end % self.capacity
+        self.size = min(self.size + len(values), self.capacity)
+
+    def values(self):
+        """
+        Returns: a copy of the kept values, from the oldest to the newest.
+        """
+        if self.size < self.capacity:
+            return self.data[:self.size].copy()
+        return np.concatenate([self.data[self.position:], self.data[:self.position]])
+
+    def __len__(self):
+        return self.size
+
+
+def is_scalar(value):
+    return isinstance(value, (int, float, np.generic))
+
+
+def is_tensor(value):
+    return hasattr(value, "detach")
+
+
+def pending_to_numpy(pending):
+    """
+    Flattens and concatenates the pending torch tensors of each key in float64 NumPy arrays.
+    The tensors of all the keys are concatenated on their device, then copied to the CPU at once, so that
+    the device is synchronized once per device.
+    Args:
+        pending: dict of key: list of tensors
+    Returns: dict of key: array
+    """
+    if not len(pending):
+        return dict()
+    import torch
+
+    pieces = {key: [None] * len(values) for key, values in pending.items()}
+    by_device = dict()  # device -> list of (key, position, flat tensor)
+    for key, values in pending.items():
+        for position, value in enumerate(values):
+            by_device.setdefault(value.device, []).append((key, position, value.reshape(-1)))
+    for tensors in by_device.values():
+        flat = torch.cat([tensor if tensor.dtype.is_floating_point and tensor.element_size() >= 4
+                          else tensor.float() for _, _, tensor in tensors])
+        array = flat.cpu().numpy().astype(np.float64, copy=False)
+        splits = np.cumsum([tensor.numel() for _, _, tensor in tensors])[:-1]
+        for (key, position, _), values in zip(tensors, np.split(array, splits)):
+            pieces[key][position] = values
+    return {key: np.concatenate(key_pieces) for key, key_pieces in pieces.items()}
+
+
+class Reducer:
+    """
+    Merges the statistics of the Metrics of several processes. Each process calls `reduce` in
+    `Metrics.compute_average` with the statistics of its print interval. The process of rank 0 gets the merged
+    statistics, and is the only one printing and writing to the SummaryWriter.
+    """
+    rank = 0
+
+    def reduce(self, stats):
+        """
+        Args:
+            stats: dict of key: RunningStats of the print interval of this process
+        Returns: on rank 0, dict of key: RunningStats merged over the processes. None on the other ranks.
+        """
+        return stats
+
+    @staticmethod
+    def merge(stats, messages):
+        for message in messages:
+            for key, other in message.items():
+                if key in stats:
+                    stats[key].merge(other)
+                else:
+                    stats[key] = other
+        return stats
+
+
+class PipeReducer(Reducer):
+    """
+    Reduces over processes of the same machine (such as DataLoader workers) with multiprocessing pipes.
+    Processes do not have to print at the same steps: the other ranks send their statistics at each print, and
+    rank 0 merges the messages received since its last print.
+    The other ranks send from a background thread, so they do not wait for rank 0 to read the pipe: the
+    statistics of the prints made during a send are merged and sent together. Use `flush` to wait for the sends.
+    Use `PipeReducer.create(world_size)` before starting the processes, and give reducers[rank] to each process.
+    """
+
+    def __init__(self, rank, connections):
+        self.rank = rank
+        self.connections = connections
+        self._init_sender()
+
+    def _init_sender(self):
+        self.unsent = dict()
+        self.sending = False
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def __getstate__(self):
+        return dict(rank=self.rank, connections=self.connections)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_sender()
+
+    @classmethod
+    def create(cls, world_size):
+        """
+        Returns: list of the reducers of each rank.
+        """
+        pipes = [multiprocessing.Pipe(duplex=False) for _ in range(world_size - 1)]
+        reducers = [cls(0, [receiver for receiver, _ in pipes])]
+        reducers.extend(cls(rank + 1, [sender]) for rank, (_, sender) in enumerate(pipes))
+        return reducers
+
+    def reduce(self, stats):
+        if self.rank:
+            with self.condition:
+                # The statistics are copied as Metrics keeps them.
+                self.merge(self.unsent, [copy.deepcopy(stats)])
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._send_loop, daemon=True)
+                    self.thread.start()
+                self.condition.notify_all()
+            return None
+        messages = []
+        for connection in self.connections:
+            while connection.poll():
+                messages.append(connection.recv())
+        return self.merge(stats, messages)
+
+    def _send_loop(self):
+        while True:
+            with self.condition:
+                self.sending = False
+                self.condition.notify_all()
+                while not len(self.unsent):
+                    self.condition.wait()
+                stats, self.unsent = self.unsent, dict()
+                self.sending = True
+            self.connections[0].send(stats)
+
+    def flush(self):
+        """
+        Waits until the statistics of this rank are sent to rank 0.
+        """
+        with self.condition:
+            while len(self.unsent) or self.sending:
+                self.condition.wait()
+
+
+class TorchDistributedReducer(Reducer):
+    """
+    Reduces over the ranks of a torch.distributed process group (such as DDP ranks with the gloo backend).
+    All the ranks must print at the same steps: the statistics are gathered on rank 0 in one message per rank.
+    """
+
+    def __init__(self, group=None):
+        import torch.distributed as dist
+
+        self.group = group
+        self.rank = dist.get_rank(group)
+        self.world_size = dist.get_world_size(group)
+
+    def reduce(self, stats):
+        import torch.distributed as dist
+
+        messages = [None] * self.world_size if not self.rank else None
+        dist.gather_object(stats, messages, dst=0, group=self.group)
+        if self.rank:
+            return None
+        return self.merge(stats, messages[1:])
+
+
 class Metrics:
     """
     Handle metrics, computes averages, log in Summary writer and print in console.
+    Values are reduced in constant memory per key (see `RunningStats`).
+    Tensors and arrays are kept as is until `compute_average`, so logging a device tensor (such as the loss)
+    does not synchronize the device at each step, but once per print interval.
     """
 
-    def __init__(self, writer=None, print_every=50, first_epoch=0, prefix=None, no_op=False):
+    def __init__(self, writer=None, print_every=50, first_epoch=0, prefix=None, no_op=False, history_size=0,
+                 quantile_keys=None, quantiles=(0.5, 0.95, 0.99), relative_accuracy=0.01, reducer=None):
         """
         Args:
             writer: SummaryWriter object if want to log in Tensorboard.
@@ -14,42 +413,122 @@ class Metrics:
             first_epoch:
             prefix: A prefix to set when logging.
             no_op: If true, acts as no_op
+            history_size: if > 0, the last history_size values of each key of the epoch are kept
+                (see `history`). Default: 0
+            quantile_keys: keys whose quantiles are estimated with a QuantileSketch. The quantiles of each print
+                interval are printed and logged as scalars ("{prefix}_{key}_p95") and histograms.
+            quantiles: quantiles to print and log. Default: (0.5, 0.95, 0.99)
+            relative_accuracy: relative accuracy of the quantile sketches. Default: 0.01
+            reducer: Reducer merging the statistics of several processes at each print (see `PipeReducer` and
+                `TorchDistributedReducer`). Only rank 0 prints and writes. Default: no reduction
         """
         self.writer = writer
 
+        # Statistics of the epoch, updated every print_every steps.
         self.metrics = dict()
+        # Statistics of the values added since the last print.
         self.buffer = dict()
+        # Tensors and arrays added since the last print, reduced in `compute_average`.
+        self.pending = dict()
+        # Average of the last print interval.
         self.running_avg = dict()
+        # Statistics of the last print interval.
+        self.intervals = dict()
+        self.quantile_keys = set() if quantile_keys is None else set(quantile_keys)
+        self.quantiles = quantiles
+        self.relative_accuracy = relative_accuracy
+        self.history_size = history_size
+        self.histories = dict()
         self.prefix = "" if prefix is None else prefix
 
         self.current_step = 0
         self.epoch = first_epoch
         self.print_every = print_every
         self.no_op = no_op
+        self.reducer = reducer
+
+    def _new_stats(self, key):
+        if key in self.quantile_keys:
+            return RunningStats(QuantileSketch(self.relative_accuracy))
+        return RunningStats()
+
+    def _init_key(self, key):
+        self.buffer[key] = self._new_stats(key)
+        self.metrics[key] = self._new_stats(key)
+        self.running_avg[key] = math.nan
+        if self.history_size:
+            self.histories[key] = RingBuffer(self.history_size)
 
     def add(self, key, value):
         """
         Add a value in the buffer
         Args:
             key:
-            value:
+            value: number, NumPy array or framework tensor (such as a torch tensor on GPU). Tensors are not
+                converted before `compute_average`, the other values are reduced right away.
 
         Returns:
         """
         if not self.no_op:
-            self.extend(key, [value])
+            if key not in self.buffer.keys():
+                self._init_key(key)
+            if is_tensor(value):
+                self._defer(key, value)
+                return
+            if not is_scalar(value):
+                self.extend(key, value)
+                return
+            self.buffer[key].add(value)
+            if self.history_size:
+                self.histories[key].add(value)
 
     def extend(self, key, values):
         if not self.no_op:
-            if key in self.buffer.keys():
+            if isinstance(values, (list, tuple)) and not all(is_scalar(value) for value in values):
+                for value in values:
+                    self.add(key, value)
+                return
+            if key not in self.buffer.keys():
+                self._init_key(key)
+            if is_tensor(values):
+                self._defer(key, values)
+                return
+            self.buffer[key].extend(values)
+            if self.history_size:
+                self.histories[key].extend(values)
+
+    def add_batch(self, content_dict):
+        """
+        Adds a batch of values per key, such as per-sample metrics. NumPy arrays (or lists) are reduced
+        chunk by chunk with vectorized operations, tensors are deferred as in `add`.
+        Args:
+            content_dict: dict of key: array of values
+        """
+        if not self.no_op:
+            for key, values in content_dict.items():
+                if isinstance(values, (list, tuple)) and not all(is_scalar(value) for value in values):
+                    self.extend(key, values)
+                    continue
+                if key not in self.buffer.keys():
+                    self._init_key(key)
+                if is_tensor(values):
+                    self._defer(key, values)
+                    continue
+                values = np.ascontiguousarray(values, dtype=np.float64).reshape(-1)
                 self.buffer[key].extend(values)
-            else:
-                self.buffer[key] = values
+                if self.history_size:
+                    self.histories[key].extend(values)
+
+    def _defer(self, key, tensor):
+        # Detaching does not synchronize the device, and the autograd graph is not kept until the print.
+        self.pending.setdefault(key, []).append(tensor.detach())
 
-            if key not in self.metrics.keys():
-                self.metrics[key] = []
-            if key not in self.running_avg.keys():
-                self.running_avg[key] = []
+    def _reduce_pending(self):
+        for key, values in pending_to_numpy(self.pending).items():
+            self.buffer[key].extend(values)
+            if self.history_size:
+                self.histories[key].extend(values)
+        self.pending = dict()
 
     def new_epoch(self):
         """
@@ -57,8 +536,10 @@ class Metrics:
         """
         if not self.no_op:
             for key in self.metrics.keys():
-                self.metrics[key] = []
-                self.running_avg[key] = []
+                self.metrics[key] = self._new_stats(key)
+                self.running_avg[key] = math.nan
+                if self.history_size:
+                    self.histories[key] = RingBuffer(self.history_size)
 
             self.current_step = 0
             self.epoch += 1
@@ -73,10 +554,9 @@ class Metrics:
             force_print: if print is False, will only print every self.print_every iterations. Otherwise will print now.
         """
         if not self.no_op:
-            if content_dict is None:
-                content_dict = dict()
-            for key, value in content_dict.items():
-                self.add(key, value)
+            if content_dict is not None:
+                for key, value in content_dict.items():
+                    self.add(key, value)
 
             if step is not None:
                 self.current_step = step
@@ -89,25 +569,76 @@ class Metrics:
 
     def compute_average(self):
         if not self.no_op:
-            for key, values in self.buffer.items():
-                average = np.mean(values)
-                self.running_avg[key].append(average)
-                self.metrics[key].extend(values)
-                self.buffer[key] = []
+            self._reduce_pending()
+            if self.reducer is not None:
+                merged = self.reducer.reduce({key: stats for key, stats in self.buffer.items() if stats.count})
+                for key, stats in (merged or dict()).items():
+                    if key not in self.buffer.keys():
+                        self._init_key(key)
+                    self.buffer[key] = stats
+            for key, stats in self.buffer.items():
+                if stats.count:
+                    self.running_avg[key] = stats.mean
+                    self.intervals[key] = stats
+                    self.metrics[key].merge(stats)
+                    self.buffer[key] = self._new_stats(key)
+
+    def _format_quantiles(self, key):
+        if key not in self.intervals or self.intervals[key].sketch is None:
+            return ""
+        values = self.intervals[key].sketch.quantiles(self.quantiles)
+        return " [" + ", ".join(f"p{q * 100:g}: {value:0.3f}" for q, value in zip(self.quantiles, values)) + "]"
+
+    @property
+    def is_main(self):
+        return self.reducer is None or self.reducer.rank == 0
 
     def print(self):
-        if not self.no_op:
+        if not self.no_op and self.is_main:
             msg = f"{self.prefix} [Epoch {self.epoch}] [Step {self.current_step}]: "
-            msg += ", ".join([f"{key}: {self.metrics[key][-1]:0.3f} ({self.running_avg[key][-1]:0.3f})"
+            msg += ", ".join([f"{key}: {self.metrics[key].last:0.3f} ({self.running_avg[key]:0.3f})"
+                              + self._format_quantiles(key)
                               for key in self.running_avg.keys()])
             print(msg)
 
             if self.writer is not None:
                 for key in self.metrics.keys():
-                    if len(self.metrics[key]):
-                        self.writer.add_scalar(self.prefix + "_" + key, self.running_avg[key][-1], self.current_step)
+                    if self.metrics[key].count:
+                        self.writer.add_scalar(self.prefix + "_" + key, self.running_avg[key], self.current_step)
+                    if key in self.intervals and self.intervals[key].sketch is not None:
+                        self._write_quantiles(key, self.intervals[key])
+
+    def _write_quantiles(self, key, stats):
+        tag = self.prefix + "_" + key
+        for q, value in zip(self.quantiles, stats.sketch.quantiles(self.quantiles)):
+            self.writer.add_scalar(f"{tag}_p{q * 100:g}", value, self.current_step)
+        buckets = stats.sketch.buckets()
+        self.writer.add_histogram_raw(tag, min=stats.min, max=stats.max, num=stats.count, sum=stats.sum,
+                                      sum_squares=stats.m2 + stats.count * stats.mean ** 2,
+                                      bucket_limits=[upper for _, upper, _ in buckets],
+                                      bucket_counts=[count for _, _, count in buckets],
+                                      global_step=self.current_step)
+
+    def quantile(self, key, q):
+        """
+        Returns: estimation of the quantile q of the values of the key in the epoch. The key must be in
+            quantile_keys.
+        """
+        return self.metrics[key].sketch.quantile(q)
+
+    def stats(self, key):
+        """
+        Returns: the RunningStats of the key for the epoch (count, sum, mean, var, std, min, max, last).
+        """
+        return self.metrics[key]
+
+    def history(self, key):
+        """
+        Returns: NumPy array of the last `history_size` values of the key in the epoch.
+        """
+        return self.histories[key].values()
 
     def __getitem__(self, item):
         if self.no_op:
             return None
-        return np.mean(self.metrics[item])
\ No newline at end of file
+        return self.metrics[item].mean
@@ -1,34 +1,158 @@
 import inspect
+import os
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from munch import Munch
 from sacred import Experiment as SacredExperiment, SETTINGS
 from sacred.config.custom_containers import ReadOnlyDict
+from sacred.dependencies import Source, get_commit_if_possible, get_digest
 from sacred.observers import FileStorageObserver, MongoObserver
 from sacred.utils import apply_backspaces_and_linefeeds
 
-from pin.config import load_config, update_argv_from_arguments
+from pin.config import SNAPSHOT_DIR, ConfigIndex, load_config, update_argv_from_arguments
 from pin.constants import DEBUG
 
 dict_types = [dict, ReadOnlyDict]
 
 
-def add_dir_sources(experiment, path, allowed_exts=None):
+SOURCE_INDEX = "source_index.json"
+
+
+def exclude_regex(pattern):
+    """
+    Translates a .gitignore pattern into a regex matching the relative paths (with "/" separators) it excludes.
+    Returns: (compiled regex, True if the pattern is a negation ("!pattern"), True if it only matches directories)
+    """
+    negated = pattern.startswith("!")
+    pattern = pattern[1:] if negated else pattern
+    directory_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    # Patterns with a "/" are relative to the root, the others match at any depth.
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    regex = ""
+    for token in re.split(r"(/\*\*/|\*\*/|/\*\*|\*\*|\*|\?|\[[^\]]*\])", pattern):
+        if token == "/**/":
+            regex += "/(?:.*/)?"
+        elif token == "**/":
+            regex += "(?:.*/)?"
+        elif token == "/**":
+            regex += "/.*"
+        elif token == "**":
+            regex += ".*"
+        elif token == "*":
+            regex += "[^/]*"
+        elif token == "?":
+            regex += "[^/]"
+        elif token.startswith("[") and token.endswith("]") and len(token) > 2:
+            regex += "[" + token[1:-1].replace("!", "^", 1) + "]" if token[1] == "!" else token
+        else:
+            regex += re.escape(token)
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return re.compile(regex + "$"), negated, directory_only
+
+
+def read_exclude_patterns(path):
+    """
+    Returns: the patterns of a .gitignore file, or an empty list if it does not exist.
+    """
+    try:
+        with open(path, "r") as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return []
+    return [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+
+
+def is_excluded(relative_path, is_dir, patterns):
+    """
+    Args:
+        relative_path: path relative to the source directory, with "/" separators
+        is_dir: if the path is a directory
+        patterns: list of compiled patterns (see `exclude_regex`). The last matching pattern wins.
+    """
+    excluded = False
+    for regex, negated, directory_only in patterns:
+        if (is_dir or not directory_only) and regex.match(relative_path):
+            excluded = not negated
+    return excluded
+
+
+def source_files_in(path, allowed_exts, patterns):
+    """
+    Yields os.DirEntry of the source files of a directory (recursively), in alphabetical order.
+    Excluded directories are not scanned.
+    """
+    directories = [(str(path), "")]
+    while len(directories):
+        directory, relative_directory = directories.pop()
+        with os.scandir(directory) as scanned_entries:
+            entries = sorted(scanned_entries, key=lambda entry: entry.name)
+        sub_directories = []
+        for entry in entries:
+            relative_path = relative_directory + entry.name
+            is_dir = entry.is_dir()
+            if entry.name in [".git", SNAPSHOT_DIR] or is_excluded(relative_path, is_dir, patterns):
+                continue
+            if is_dir:
+                sub_directories.append((entry.path, relative_path + "/"))
+            elif os.path.splitext(entry.name)[1] in allowed_exts:
+                yield entry
+        directories.extend(reversed(sub_directories))
+
+
+def add_dir_sources(experiment, path, allowed_exts=None, exclude=None, use_gitignore=True, index=True,
+                    max_workers=None):
     """
     Add a directory to sacred source files
+    Files are hashed in a thread pool, and their digests are kept in an index
+    (`path/__pincache__/source_index.json`), so files unchanged since the last run are not read again.
     Args:
         experiment:
         path:
-        allowed_exts:
+        allowed_exts: extensions of the source files. Default: [".py"]
+        exclude: list of .gitignore-style patterns of files and directories not to add.
+        use_gitignore: if True, the patterns of `path/.gitignore` are also excluded. Default: True
+        index: if True, digests are cached in the index. Default: True
+        max_workers: number of threads hashing the files. Default: ThreadPoolExecutor default
     """
     allowed_exts = ['.py'] if allowed_exts is None else allowed_exts
     path = Path(path) if not isinstance(path, Path) else path
-    for sub_file in path.iterdir():
-        if sub_file.is_dir():
-            add_dir_sources(experiment, sub_file)
-        elif sub_file.suffix in allowed_exts:
-            experiment.add_source_file(sub_file)
+    patterns = read_exclude_patterns(path / ".gitignore") if use_gitignore else []
+    patterns = [exclude_regex(pattern) for pattern in patterns + list(exclude or [])]
+    source_index = ConfigIndex(str(path / SNAPSHOT_DIR / SOURCE_INDEX)) if index else None
+
+    files = []
+    to_hash = []
+    for entry in source_files_in(path, allowed_exts, patterns):
+        # Same file name as `Experiment.add_source_file`.
+        filename = os.path.abspath(entry.path)
+        stat = entry.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        digest = source_index.get(filename, stamp) if source_index is not None else None
+        files.append([filename, digest])
+        if digest is None:
+            to_hash.append((files[-1], stamp))
+    if len(to_hash):
+        with ThreadPoolExecutor(max_workers) as executor:
+            digests = executor.map(get_digest, [file[0] for file, _ in to_hash])
+            for (file, stamp), digest in zip(to_hash, digests):
+                file[1] = digest
+                if source_index is not None:
+                    source_index.update(file[0], stamp, digest)
+    if source_index is not None:
+        source_index.save()
+
+    if not len(files):
+        return
+    # All the files of the directory share the git information of the repository of the first file.
+    repo, commit, is_dirty = get_commit_if_possible(files[0][0], experiment.save_git_info)
+    for filename, digest in files:
+        experiment.sources.add(Source(filename, digest, repo, commit, is_dirty))
 
 
 def get_sacred_conf(config_root):
@@ -86,25 +210,24 @@ class Experiment(SacredExperiment):
             self.observers.append(observer)
             print("Added File Storage Observer in", sacred_conf['sacred']['file_storage']['path'])
 
-        for file in configs:
-            path = str(project_directory / "config" / file)
-            config = load_config(path, to_container=True)
-            update_argv_from_arguments(sys.argv, config, path)
-            # FIXME: what if the config is a ListConf?
-            #  Same for the next one.
-            self.add_config(config)
-
+        configs = configs if configs is not None else []
+        paths = [str(project_directory / "config" / file) for file in configs]
         if debug_mode:
-            path = str(project_directory / "config/debug.yaml")
-            config = load_config(path, to_container=True)
+            paths.append(str(project_directory / "config/debug.yaml"))
+        # Files are loaded concurrently, but added in order.
+        for path, config in zip(paths, load_config(paths, to_container=True)):
             update_argv_from_arguments(sys.argv, config, path)
+            # FIXME: what if the config is a ListConf?
             self.add_config(config)
 
-    def add_source_dir(self, source_dir):
+    def add_source_dir(self, source_dir, **kwargs):
+        """
+        Adds the source files of directories of the project (see `add_dir_sources` for the options).
+        """
         if type(source_dir) not in [list, tuple]:
             source_dir = [source_dir]
         for source in source_dir:
-            add_dir_sources(self, self.project_directory / source)
+            add_dir_sources(self, self.project_directory / source, **kwargs)
         return self
 
 
@@ -0,0 +1,123 @@
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([("tag", "<u4"), ("step", "<i8"), ("walltime", "<f8"), ("value", "<f8")])
+SCALARS_FILE = "scalars.bin"
+TAGS_FILE = "tags.jsonl"
+
+
+class ScalarStoreWriter:
+    """
+    Appends scalars to a compact binary log in a run folder:
+    - scalars.bin: fixed-size records (tag id, step, walltime, value) (see `RECORD_DTYPE`),
+    - tags.jsonl: tag dictionary, the tag of id i is on line i.
+    Records are buffered and appended by blocks of buffer_size records.
+    """
+
+    def __init__(self, path, buffer_size=4096):
+        """
+        Args:
+            path: folder of the run
+            buffer_size: number of records written at once. Default: 4096
+        """
+        self.path = Path(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.tag_ids = {tag: tag_id for tag_id, tag in enumerate(read_tags(self.path))}
+        self.tags_file = open(self.path / TAGS_FILE, "a")
+        # A tag line truncated by a crash would be joined with the next tag.
+        self.tags_file.truncate(tags_size(self.path))
+        self.scalars_file = open(self.path / SCALARS_FILE, "ab")
+        # A record truncated by a crash would shift the next ones.
+        self.scalars_file.truncate(os.path.getsize(self.path / SCALARS_FILE) // RECORD_DTYPE.itemsize
+                                   * RECORD_DTYPE.itemsize)
+        self.buffer = np.empty(buffer_size, dtype=RECORD_DTYPE)
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def tag_id(self, tag):
+        if tag not in self.tag_ids:
+            self.tag_ids[tag] = len(self.tag_ids)
+            self.tags_file.write(json.dumps(tag) + "\n")
+            self.tags_file.flush()
+        return self.tag_ids[tag]
+
+    def add_scalar(self, tag, scalar_value, global_step=None, walltime=None):
+        self.buffer[self.size] = (self.tag_id(tag), -1 if global_step is None else global_step,
+                                  time.time() if walltime is None else walltime, scalar_value)
+        self.size += 1
+        if self.size == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        if self.size:
+            self.scalars_file.write(self.buffer[:self.size].tobytes())
+            self.scalars_file.flush()
+            self.size = 0
+
+    def close(self):
+        if not self.scalars_file.closed:
+            self.flush()
+            self.scalars_file.close()
+            self.tags_file.close()
+
+
+def tags_size(path):
+    """
+    Returns: size in bytes of the complete lines of the tags file.
+    """
+    with open(Path(path) / TAGS_FILE, "rb") as file:
+        content = file.read()
+    return content.rfind(b"\n") + 1
+
+
+def read_tags(path):
+    tags_file = Path(path) / TAGS_FILE
+    if not os.path.exists(tags_file):
+        return []
+    with open(tags_file) as file:
+        return [json.loads(line) for line in file if line.endswith("\n")]
+
+
+class ScalarStoreReader:
+    """
+    Reads the scalars written by `ScalarStoreWriter`. The log is memory-mapped: `records` and its columns
+    (`records["value"]`...) are views of the file.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.tags = read_tags(self.path)
+        self.tag_ids = {tag: tag_id for tag_id, tag in enumerate(self.tags)}
+        num_records = os.path.getsize(self.path / SCALARS_FILE) // RECORD_DTYPE.itemsize
+        if num_records:
+            self.records = np.memmap(self.path / SCALARS_FILE, dtype=RECORD_DTYPE, mode="r", shape=(num_records,))
+        else:
+            self.records = np.empty(0, dtype=RECORD_DTYPE)
+
+    def __getitem__(self, tag):
+        """
+        Returns: structured array with the step, walltime and value fields of the records of the tag.
+        """
+        if tag not in self.tag_ids:
+            raise KeyError(tag)
+        if len(self.tags) == 1:
+            return self.records
+        return self.records[self.records["tag"] == self.tag_ids[tag]]
+
+    def scalars(self):
+        """
+        Returns: dict of tag: records of the tag, computed in one pass over the log.
+        """
+        order = np.argsort(self.records["tag"], kind="stable")
+        sorted_records = self.records[order]
+        bounds = np.searchsorted(sorted_records["tag"], np.arange(len(self.tags) + 1))
+        return {tag: sorted_records[bounds[tag_id]:bounds[tag_id + 1]] for tag_id, tag in enumerate(self.tags)}
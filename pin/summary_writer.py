@@ -1,5 +1,14 @@
+import os
+import queue
+import threading
+import time
+
 import numpy as np
 
+from .scalar_store import ScalarStoreWriter
+
+_STOP = object()
+
 
 class SummaryWriter:
     """
@@ -7,15 +16,43 @@ class SummaryWriter:
     API follows the tensorboard SummaryWriter API with only a subset of the functions available.
     """
 
-    def __init__(self, tensorboard_writer=None, sacred_run=None, no_op=False):
+    def __init__(self, tensorboard_writer=None, sacred_run=None, no_op=False, background=False, batch_size=64,
+                 flush_interval=1., max_queue_size=10000, block_when_full=True, scalar_store=None):
         """
         Args:
             tensorboard_writer:
             sacred_run: _run variable from sacred
+            scalar_store: folder (or ScalarStoreWriter) where scalars are appended to a binary log, which is read
+                with `pin.scalar_store.ScalarStoreReader`.
             no_op: if True, acts as no op.
+            background: if True, scalars and histograms are queued and forwarded to the backends by a background
+                thread, so `add_scalar`, `add_scalars` and `add_histogram_raw` return immediately.
+                Call `flush` to wait for the queued events and `close` (or leave the `with` block) to write them
+                and stop the thread. Default: False
+            batch_size: maximum number of events forwarded at once by the background thread. Default: 64
+            flush_interval: maximum time (in seconds) an event waits in the background thread before being
+                forwarded. Default: 1
+            max_queue_size: maximum number of queued events. Default: 10000
+            block_when_full: if True, `add_*` blocks when the queue is full. Otherwise the event is dropped and
+                counted in `dropped`. Default: True
         """
         self.tensorboard_writer = None if no_op else tensorboard_writer
         self.sacred_writer = None if no_op else sacred_run
+        if isinstance(scalar_store, (str, os.PathLike)) and not no_op:
+            scalar_store = ScalarStoreWriter(scalar_store)
+        self.scalar_store = None if no_op else scalar_store
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_when_full = block_when_full
+        self.dropped = 0
+        self.error = None
+        self.queue = None
+        self.thread = None
+        if background and not no_op:
+            self.queue = queue.Queue(max_queue_size)
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
 
     def __enter__(self):
         return self
@@ -23,18 +60,89 @@ class SummaryWriter:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
-    def add_scalar(self, tag, scalar_value, global_step=None, walltime=None):
+    def _check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _submit(self, event):
+        if self.queue is None:
+            self._write([event])
+            return
+        self._check()
+        if self.block_when_full:
+            self.queue.put(event)
+        else:
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                batch.pop()
+                stop = True
+            try:
+                if self.error is None:
+                    self._write(batch)
+            except Exception as error:
+                self.error = error
+            finally:
+                for _ in range(len(batch) + stop):
+                    self.queue.task_done()
+
+    def _write(self, events):
+        for method, args in events:
+            method(*args)
+
+    def _write_scalar(self, tag, scalar_value, global_step, walltime):
         if self.tensorboard_writer is not None:
             self.tensorboard_writer.add_scalar(tag, scalar_value, global_step, walltime)
         if self.sacred_writer is not None:
             self.sacred_writer.log_scalar(tag, scalar_value, global_step)
+        if self.scalar_store is not None:
+            self.scalar_store.add_scalar(tag, scalar_value, global_step, walltime)
 
-    def add_scalars(self, main_tag, tag_scalar_dict, global_step=None, walltime=None):
+    def _write_scalars(self, main_tag, tag_scalar_dict, global_step, walltime):
         if self.tensorboard_writer is not None:
             self.tensorboard_writer.add_scalars(main_tag, tag_scalar_dict, global_step, walltime)
         if self.sacred_writer is not None:
             for name, value in tag_scalar_dict.items():
                 self.sacred_writer.log_scalar(f"{main_tag}_{name}", value, global_step)
+        if self.scalar_store is not None:
+            for name, value in tag_scalar_dict.items():
+                self.scalar_store.add_scalar(f"{main_tag}_{name}", value, global_step, walltime)
+
+    def _write_histogram_raw(self, *args):
+        if self.tensorboard_writer is not None:
+            self.tensorboard_writer.add_histogram_raw(*args)
+
+    def _walltime(self, walltime):
+        # Queued events keep the time they were added at.
+        return time.time() if walltime is None and self.queue is not None else walltime
+
+    def add_scalar(self, tag, scalar_value, global_step=None, walltime=None):
+        self._submit((self._write_scalar, (tag, scalar_value, global_step, self._walltime(walltime))))
+
+    def add_scalars(self, main_tag, tag_scalar_dict, global_step=None, walltime=None):
+        self._submit((self._write_scalars, (main_tag, dict(tag_scalar_dict), global_step, self._walltime(walltime))))
+
+    def add_histogram_raw(self, tag, min, max, num, sum, sum_squares, bucket_limits, bucket_counts, global_step=None,
+                          walltime=None):
+        self._submit((self._write_histogram_raw, (tag, min, max, num, sum, sum_squares, bucket_limits, bucket_counts,
+                                                  global_step, self._walltime(walltime))))
 
     def add_embedding(self, mat, metadata=None, label_img=None, global_step=None, tag='default',
                       metadata_header=None):
@@ -48,6 +156,27 @@ class SummaryWriter:
     def save_artifact(self, build, content_dict):
         pass
 
+    def flush(self):
+        """
+        Waits until the queued events are forwarded to the backends.
+        """
+        if self.queue is not None:
+            self.queue.join()
+            self._check()
+        if self.scalar_store is not None:
+            self.scalar_store.flush()
+
     def close(self):
-        if self.tensorboard_writer is not None:
-            self.tensorboard_writer.close()
+        if self.thread is not None:
+            # The events queued before are written before the thread stops.
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+            self.queue = None
+        try:
+            self._check()
+        finally:
+            if self.tensorboard_writer is not None:
+                self.tensorboard_writer.close()
+            if self.scalar_store is not None:
+                self.scalar_store.close()
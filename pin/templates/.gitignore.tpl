@@ -1,5 +1,6 @@
 # Byte-compiled / optimized / DLL files
 __pycache__/
+__pincache__/
 *.py[cod]
 *$py.class
 
@@ -3,7 +3,9 @@ from setuptools import find_packages, setup
 setup(name='pin',
       version='0.0.8',
       py_modules=['pin'],
+      python_requires='>=3.7',
       install_requires=['sacred', 'Click', 'omegaconf==1.4.1', 'ruamel.yaml'],
+      extras_require={'zstd': ['zstandard'], 'lz4': ['lz4']},
       packages=find_packages(),
       package_data={'pin': ['templates/config/*',
                             'templates/*',
@@ -0,0 +1,279 @@
+import hashlib
+import os
+import pickle
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from pin.artifact import Artifact, DiskQuota, KeepEveryN, KeepLast, KeepTopK, detect_codec, get_codec
+
+
+class PickleArtifact(Artifact):
+    def write(self, content, file, **kwargs):
+        pickle.dump(content, file)
+
+    def load(self, version="best", **kwargs):
+        with self.open_file(self.path / self.name.format(version=version)) as file:
+            return pickle.load(file)
+
+
+class FailingArtifact(PickleArtifact):
+    def write(self, content, file, **kwargs):
+        raise OSError("disk full")
+
+
+def test_async_checkpoint(tmp_path):
+    artifact = PickleArtifact(tmp_path, "model_{version}.pkl", async_save=True)
+    with artifact:
+        artifact.update({"weights": [1, 2]})
+        artifact.checkpoint(metric=1)
+        # The snapshot is not affected by further updates.
+        artifact.artifact["weights"].append(3)
+        artifact.checkpoint(metric=0)
+    assert artifact.load(version=1) == {"weights": [1, 2]}
+    assert artifact.load(version=2) == {"weights": [1, 2, 3]}
+    assert artifact.load(version="best") == {"weights": [1, 2]}
+
+
+def test_async_checkpoint_error(tmp_path):
+    artifact = FailingArtifact(tmp_path, "model_{version}.pkl", async_save=True)
+    artifact.checkpoint()
+    with pytest.raises(OSError, match="disk full"):
+        artifact.wait()
+
+
+def test_async_checkpoint_written_at_exit(tmp_path):
+    script = textwrap.dedent("""
+        import pickle, sys, time
+        from pin.artifact import Artifact
+
+        class SlowArtifact(Artifact):
+            def write(self, content, file, **kwargs):
+                time.sleep(0.5)
+                pickle.dump(content, file)
+
+        artifact = SlowArtifact(sys.argv[1], "model_{version}.pkl", async_save=True)
+        artifact.update({"epoch": 1})
+        artifact.checkpoint()
+    """)
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).resolve().parents[1]))
+    subprocess.run([sys.executable, "-c", script, str(tmp_path)], env=env, check=True)
+    with open(tmp_path / "model_1.pkl", "rb") as file:
+        assert pickle.load(file) == {"epoch": 1}
+
+
+class SaveArtifact(Artifact):
+    """
+    Artifact only overriding `save`.
+    """
+
+    def save(self, filename, **kwargs):
+        with open(filename, "wb") as file:
+            pickle.dump(self.artifact, file)
+
+
+def test_checkpoint_with_save(tmp_path):
+    artifact = SaveArtifact(tmp_path, "model_{version}.pkl", async_save=True)
+    artifact.update({"epoch": 1})
+    artifact.checkpoint(metric=1)
+    artifact.wait()
+    with open(tmp_path / "model_best.pkl", "rb") as file:
+        assert pickle.load(file) == {"epoch": 1}
+    assert artifact.saved_versions[1]["size"] == os.path.getsize(tmp_path / "model_1.pkl")
+
+
+def test_best_checkpoint_is_a_link(tmp_path):
+    artifact = PickleArtifact(tmp_path, "model_{version}.pkl", num_kept_versions=1)
+    artifact.update({"epoch": 1})
+    artifact.checkpoint(metric=1)
+    artifact.update({"epoch": 2})
+    artifact.checkpoint(metric=0)
+    assert artifact.best_version == 1
+    assert os.path.samefile(tmp_path / "model_best.pkl", tmp_path / "model_1.pkl")
+    assert artifact.load(version="best") == {"epoch": 1}
+
+
+def test_manifest_and_resume(tmp_path):
+    artifact = PickleArtifact(tmp_path, "model_{version}.pkl")
+    for epoch in range(3):
+        artifact.update({"epoch": epoch})
+        artifact.checkpoint(metric=-abs(epoch - 1))
+    # An interrupted write leaves a temporary file and a truncated manifest line.
+    (tmp_path / "model_4.pkl.tmp").write_bytes(b"trunc")
+    with open(artifact.manifest.path, "a") as file:
+        file.write('{"version": 4, "fi')
+
+    records = artifact.manifest.records()
+    assert [record["version"] for record in records if "version" in record] == [1, 2, 3]
+    assert records[0]["size"] == os.path.getsize(tmp_path / "model_1.pkl")
+
+    resumed = PickleArtifact(tmp_path, "model_{version}.pkl")
+    assert resumed.resume() == {"epoch": 2}
+    assert resumed.version == 4
+    assert resumed.best_version == 2
+
+
+def test_resume_from_recovery(tmp_path):
+    artifact = PickleArtifact(tmp_path, "m_{version}.pkl", retention=KeepLast(2))
+    with pytest.raises(RuntimeError):
+        with artifact:
+            for epoch in range(4):
+                artifact.update({"epoch": epoch})
+                artifact.checkpoint(metric=epoch)
+            artifact.update({"epoch": "crashed"})
+            raise RuntimeError("crash")
+    assert (tmp_path / "m_recovery.pkl").exists()
+
+    resumed = PickleArtifact(tmp_path, "m_{version}.pkl", retention=KeepLast(2))
+    assert resumed.resume() == {"epoch": "crashed"}
+    # The state of the saved versions is restored as well.
+    assert (resumed.version, resumed.best_version, resumed.best_version_value) == (5, 4, 3)
+    assert sorted(resumed.saved_versions.keys()) == [3, 4]
+    resumed.update({"epoch": 4})
+    resumed.checkpoint(metric=0)
+    resumed.wait()
+    assert sorted(file for file in os.listdir(tmp_path) if file.endswith(".pkl")) == ["m_4.pkl", "m_5.pkl",
+                                                                                     "m_best.pkl"]
+    assert resumed.load(version="best") == {"epoch": 3}
+
+
+def test_retention_policies(tmp_path):
+    metrics = [5, 1, 9, 2, 3, 0, 4]
+    artifact = PickleArtifact(tmp_path, "model_{version}.pkl",
+                              retention=[KeepLast(2), KeepTopK(2), KeepEveryN(3)])
+    for epoch, metric in enumerate(metrics):
+        artifact.update({"epoch": epoch})
+        artifact.checkpoint(metric=metric)
+    artifact.wait()
+    # Last: 6, 7. Top 2: 3 (9), 1 (5). Every 3: 3, 6.
+    assert sorted(artifact.saved_versions.keys()) == [1, 3, 6, 7]
+    assert sorted(os.listdir(tmp_path)) == ["model_1.pkl", "model_3.pkl", "model_6.pkl", "model_7.pkl",
+                                            "model_best.pkl", "model_manifest.pkl.jsonl"]
+
+    # The state of the policies survives a resume.
+    resumed = PickleArtifact(tmp_path, "model_{version}.pkl", retention=[KeepLast(1), DiskQuota(0)])
+    resumed.resume()
+    resumed.checkpoint(metric=0)
+    resumed.wait()
+    assert sorted(resumed.saved_versions.keys()) == [3]
+
+
+def test_sharded_checkpoint(tmp_path):
+    artifact = PickleArtifact(tmp_path, "model_{version}", num_kept_versions=1, sharded=True)
+    artifact.update({"encoder": [1], "decoder": [2]})
+    artifact.checkpoint(metric=1)
+    artifact.checkpoint(metric=0)
+    artifact.checkpoint(metric=0)
+    artifact.wait()
+
+    assert sorted(os.listdir(tmp_path)) == ["model_1", "model_3", "model_best", "model_manifest.jsonl"]
+    shard_files = artifact.shard_files("best", keys=["decoder"])
+    assert list(shard_files.keys()) == ["decoder"]
+    with open(shard_files["decoder"], "rb") as file:
+        assert pickle.load(file) == [2]
+    assert artifact.manifest.records()[0]["size"] == sum(
+        os.path.getsize(path) for path in artifact.shard_files(1).values())
+
+
+class BlobArtifact(PickleArtifact):
+    """Saves each value in a blob named after its content."""
+
+    def write(self, content, file, **kwargs):
+        keys = dict()
+        for name, value in content.items():
+            keys[name] = hashlib.sha1(value).hexdigest()
+            self.write_blob(keys[name], lambda blob_file: blob_file.write(value))
+        pickle.dump(keys, file)
+        return keys.values()
+
+
+def test_blobs_are_shared_between_versions(tmp_path):
+    artifact = BlobArtifact(tmp_path, "model_{version}.pkl", retention=KeepLast(2))
+    frozen = hashlib.sha1(b"frozen").hexdigest()
+    for epoch in range(3):
+        artifact.update({"frozen": b"frozen", "head": f"head {epoch}".encode()})
+        artifact.checkpoint()
+    artifact.wait()
+    blobs = sorted(os.listdir(tmp_path / "model_blobs.pkl"))
+    # The blob of the first head is removed with its version, the frozen blob is written once.
+    assert blobs == sorted([frozen] + [hashlib.sha1(f"head {epoch}".encode()).hexdigest() for epoch in (1, 2)])
+    assert artifact.blob_references[frozen] == 2
+
+    resumed = BlobArtifact(tmp_path, "model_{version}.pkl", retention=KeepLast(2))
+    resumed.resume()
+    assert resumed.blob_references == artifact.blob_references
+
+
+def test_disk_quota_counts_blobs_once(tmp_path):
+    versions = {1: dict(size=10, blob_sizes={"a": 100}),
+                2: dict(size=10, blob_sizes={"a": 100, "b": 20}),
+                3: dict(size=10, blob_sizes={"a": 100})}
+    assert DiskQuota(150).keep(versions) == {1, 2, 3}
+    assert DiskQuota(139).keep(versions) == {3}
+
+    artifact = BlobArtifact(tmp_path, "model_{version}.pkl")
+    artifact.update({"frozen": b"frozen"})
+    artifact.checkpoint()
+    assert artifact.saved_versions[1]["blob_sizes"] == {hashlib.sha1(b"frozen").hexdigest(): len(b"frozen")}
+
+
+def test_torch_dedup(tmp_path):
+    torch = pytest.importorskip("torch")
+    from pin.artifact import TorchModelArtifact
+
+    frozen = torch.arange(4096, dtype=torch.float32)
+    storage = torch.zeros(8192)
+    artifact = TorchModelArtifact(tmp_path, "model_{version}.pt", dedup=True, retention=KeepLast(1))
+    for epoch in range(3):
+        storage[:2048] = epoch
+        artifact.update({"model": {"frozen": frozen, "head": storage[:2048], "step": torch.tensor(epoch)}})
+        artifact.checkpoint()
+    artifact.wait()
+    loaded = artifact.load({"model": None}, version=3)["model"]
+    assert torch.equal(loaded["frozen"], frozen)
+    assert torch.equal(loaded["head"], torch.full((2048,), 2.))
+    assert loaded["step"].item() == 2
+    # The blobs of the removed versions are removed, the frozen tensor is written once.
+    blobs = os.listdir(tmp_path / "model_blobs.pt")
+    assert sorted(blobs) == sorted([TorchModelArtifact.tensor_hash(frozen),
+                                    TorchModelArtifact.tensor_hash(torch.full((2048,), 2.))])
+    # A view is saved without the rest of its storage.
+    head_blob = TorchModelArtifact.tensor_hash(torch.full((2048,), 2.))
+    assert os.path.getsize(tmp_path / "model_blobs.pt" / head_blob) < 8192 * 4
+
+
+def test_torch_sharded_load(tmp_path):
+    torch = pytest.importorskip("torch")
+    from pin.artifact import TorchModelArtifact
+
+    model = torch.nn.Linear(4, 2)
+    artifact = TorchModelArtifact(tmp_path, "model_{version}.pt", sharded=True)
+    artifact.update({"model": model, "optimizer": {"lr": torch.tensor(0.1)}})
+    artifact.checkpoint()
+    # Only the shards of the given keys are read.
+    os.remove(artifact.shard_files(1, ["optimizer"])["optimizer"])
+    loaded = torch.nn.Linear(4, 2)
+    artifact.load({"model": loaded}, version=1)
+    assert torch.equal(loaded.weight, model.weight)
+    assert torch.equal(loaded.bias, model.bias)
+
+
+@pytest.mark.parametrize("codec", ["none", "zstd", "lz4"])
+def test_codecs(tmp_path, codec):
+    if codec != "none":
+        pytest.importorskip({"zstd": "zstandard", "lz4": "lz4"}[codec])
+    artifact = PickleArtifact(tmp_path, "model_{version}.pkl", codec=codec)
+    artifact.update({"weights": [0.0] * 10000})
+    artifact.checkpoint()
+    assert detect_codec(tmp_path / "model_1.pkl").name == codec
+    assert artifact.load(version=1) == {"weights": [0.0] * 10000}
+    # Files are decompressed whatever the codec of the artifact reading them.
+    assert PickleArtifact(tmp_path, "model_{version}.pkl").load(version=1) == {"weights": [0.0] * 10000}
+    if codec != "none":
+        # The manifest records the size on disk.
+        assert artifact.saved_versions[1]["size"] == os.path.getsize(tmp_path / "model_1.pkl") < 10000
+    with pytest.raises(ValueError, match="Unknown codec"):
+        get_codec("gzip")
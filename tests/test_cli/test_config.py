@@ -5,9 +5,9 @@ import pytest
 from click.testing import CliRunner
 
 from pin.cli.project import create
-from pin.cli.config import init_config
+from pin.cli.config import compile_configs, init_config
 from pin.cli.utils import PROJECT_DIR
-from pin.config import load_config
+from pin.config import load_config, load_snapshot, snapshot_path
 
 
 def get_test_configurations(config_file_path):
@@ -61,3 +61,112 @@ def test_init_config():
         assert conf_2.test_missing_key == "value1"
         assert conf_3.test_missing_key == "value2"
 
+
+def test_compile_config():
+    runner = CliRunner()
+
+    config_contents = get_test_configurations(['test_config_files/main.yaml',
+                                               'test_config_files/vault.yaml'])
+
+    with runner.isolated_filesystem():
+        runner.invoke(create, ['test'])
+        os.chdir('test')
+
+        shutil.rmtree('config')
+        os.mkdir('config')
+        fill_config_folder('config', config_contents)
+        # main.yaml cannot be compiled without the subfolder.
+        result = runner.invoke(compile_configs, ['vault.yaml'])
+        assert result.exit_code == 0
+        assert os.path.isfile(snapshot_path('config/vault.yaml'))
+        assert load_config('config/vault.yaml').key1 == "value1"
+
+        # An outdated snapshot is rebuilt
+        with open('config/vault.yaml', 'w') as file:
+            file.write("key1: new_value\n")
+        assert load_snapshot('config/vault.yaml') is None
+        assert load_config('config/vault.yaml').key1 == "new_value"
+        assert load_snapshot('config/vault.yaml') == {"key1": "new_value"}
+
+        result = runner.invoke(compile_configs, [])
+        assert result.exit_code != 0
+        assert "main.yaml" in result.output
+
+
+def test_init_config_check():
+    runner = CliRunner()
+
+    config_contents = get_test_configurations(['test_config_files/main_2.yaml',
+                                               'test_config_files/main_3.yaml',
+                                               'test_config_files/vault.yaml'])
+
+    with runner.isolated_filesystem():
+        runner.invoke(create, ['test'])
+        os.chdir('test')
+
+        shutil.rmtree('config')
+        os.mkdir('config')
+        fill_config_folder('config', config_contents)
+
+        result = runner.invoke(init_config, ['--check'])
+        assert result.exit_code == 1
+        assert "Missing configuration file `specific.yaml`" in result.output
+        assert "Missing key `missing_key` in `vault.yaml`" in result.output
+        assert not os.path.isfile('config/specific.yaml')
+
+        runner.invoke(init_config, ['-y', '-v', 'value1', '-v', 'value2'])
+        result = runner.invoke(init_config, ['--check'])
+        assert result.exit_code == 0
+        # Existing keys are kept.
+        assert load_config('config/vault.yaml').key1 == "value1"
+
+
+def test_init_config_changed_keeps_unsatisfied_files():
+    runner = CliRunner()
+
+    config_contents = get_test_configurations(['test_config_files/main_2.yaml',
+                                               'test_config_files/vault.yaml'])
+
+    with runner.isolated_filesystem():
+        runner.invoke(create, ['test'])
+        os.chdir('test')
+
+        shutil.rmtree('config')
+        os.mkdir('config')
+        fill_config_folder('config', config_contents)
+
+        # The creation of specific.yaml is declined: main_2.yaml must be analysed again.
+        runner.invoke(init_config, ['--changed'], input="n\n")
+        result = runner.invoke(init_config, ['--check', '--changed'])
+        assert result.exit_code == 1
+        assert "Missing configuration file `specific.yaml`" in result.output
+
+        runner.invoke(init_config, ['--changed', '-y', '-v', 'value'])
+        assert runner.invoke(init_config, ['--check', '--changed']).exit_code == 0
+        assert runner.invoke(init_config, ['--check']).exit_code == 0
+
+
+def test_init_config_changed_imported_file():
+    runner = CliRunner()
+
+    config_contents = get_test_configurations(['test_config_files/main.yaml',
+                                               'test_config_files/vault.yaml'])
+
+    with runner.isolated_filesystem():
+        runner.invoke(create, ['test'])
+        os.chdir('test')
+
+        shutil.rmtree('config')
+        os.mkdir('config')
+        fill_config_folder('config', config_contents)
+        os.remove('config/main.yaml')
+        with open('config/main.yaml', 'w') as file:
+            file.write('test: "@{vault:key1}"\n')
+
+        assert runner.invoke(init_config, ['--check', '--changed']).exit_code == 0
+        # main.yaml did not change, but the key it imports was removed.
+        with open('config/vault.yaml', 'w') as file:
+            file.write("key2: value2\n")
+        result = runner.invoke(init_config, ['--check', '--changed'])
+        assert result.exit_code == 1
+        assert "Missing key `key1` in `vault.yaml`" in result.output
@@ -1,7 +1,11 @@
 import os
 
+import pytest
+
 from pin.cli.utils import PROJECT_DIR
-from pin.config import load_config, update_argv_from_arguments
+from pin.config import (ConfigIndex, ImportCycleError, ImportReference, _lazy_resolver_confs, compile_config,
+                        configs_in, file_stamp, import_cache, invalidate_import_cache, join_imports, load_config,
+                        load_snapshot, split_imports, update_argv_from_arguments)
 
 
 def test_load_config():
@@ -20,3 +24,139 @@ def test_update_from_arguments():
     update_argv_from_arguments(args, conf, path)
     assert args[2] == "'test=value2'"
     assert args[3] == "'test2=3'"
+
+
+def test_import_cache(tmp_path):
+    (tmp_path / "main.yaml").write_text('a: "@{vault:key}"\nb: "@{vault:key}"\n')
+    (tmp_path / "vault.yaml").write_text("key: value1\n")
+    invalidate_import_cache()
+
+    conf = load_config(str(tmp_path / "main.yaml"))
+    assert conf.a == conf.b == "value1"
+    assert str(tmp_path / "vault.yaml") in import_cache
+
+    # Modifying an imported file invalidates the files importing it.
+    (tmp_path / "vault.yaml").write_text("key: value_2\n")
+    conf = load_config(str(tmp_path / "main.yaml"))
+    assert conf.a == "value_2"
+
+    invalidate_import_cache(str(tmp_path / "vault.yaml"))
+    assert str(tmp_path / "main.yaml") not in import_cache
+
+
+def test_import_cycle(tmp_path):
+    (tmp_path / "main.yaml").write_text('a: "@{other:b}"\n')
+    (tmp_path / "other.yaml").write_text('b: "@{main:a}"\n')
+    with pytest.raises(ImportCycleError, match="main.yaml:a -> other.yaml:b -> main.yaml:a"):
+        load_config(str(tmp_path / "main.yaml"))
+
+
+def test_import_graph_resolves_across_files(tmp_path):
+    # Files importing each other are fine as long as the values do not.
+    (tmp_path / "main.yaml").write_text('a: "@{other:b}"\nc: value\nd: "@{other}"\n')
+    (tmp_path / "other.yaml").write_text('b: "@{main:c}-@{shared:key}"\ne: "@{shared:key}"\n')
+    (tmp_path / "shared.yaml").write_text("key: shared\n")
+
+    conf = load_config(str(tmp_path / "main.yaml"))
+    assert conf.a == "value-shared"
+    assert conf.d.b == "value-shared"
+    assert conf.d.e == "shared"
+
+
+def test_lazy_load_config(tmp_path):
+    (tmp_path / "main.yaml").write_text('a: "x-@{vault:key}-y"\nb: "@{missing:key}"\nc: "@{vault}"\n')
+    (tmp_path / "vault.yaml").write_text("key: value\n")
+
+    conf = load_config(str(tmp_path / "main.yaml"), lazy=True)
+    assert conf.a == "x-value-y"
+    assert conf.c.key == "value"
+    # missing.yaml is only opened when b is read.
+    with pytest.raises(FileNotFoundError):
+        conf.b
+
+
+def test_lazy_imports_share_the_imported_file(tmp_path):
+    (tmp_path / "main.yaml").write_text("".join(f'm{i}: "@{{vault:k{i}}}"\n' for i in range(3)) + 'n: "@{link:k}"\n')
+    (tmp_path / "vault.yaml").write_text("".join(f"k{i}: v{i}\n" for i in range(3)))
+    (tmp_path / "link.yaml").write_text('k: "@{vault:k0}"\n')
+
+    invalidate_import_cache()
+    conf = load_config(str(tmp_path / "main.yaml"), lazy=True)
+    assert [conf.m0, conf.m1, conf.m2, conf.n] == ["v0", "v1", "v2", "v0"]
+    # All the keys were read from one copy of vault.yaml.
+    assert len(_lazy_resolver_confs) == 2
+    # Files importing a modified file read its new content.
+    (tmp_path / "vault.yaml").write_text("k0: new\n")
+    assert load_config(str(tmp_path / "main.yaml"), lazy=True).n == "new"
+
+
+def test_lazy_loads_do_not_share_imported_values(tmp_path):
+    (tmp_path / "main.yaml").write_text('b: "@{vault:b}"\n')
+    (tmp_path / "vault.yaml").write_text("b:\n  y: 1\n")
+
+    conf = load_config(str(tmp_path / "main.yaml"), lazy=True)
+    conf.b.y = 5
+    assert load_config(str(tmp_path / "main.yaml"), lazy=True).b.y == 1
+
+
+def test_compiled_config_keeps_interpolations(tmp_path, monkeypatch):
+    (tmp_path / "main.yaml").write_text('home: ${env:PIN_TEST_HOME}\nkey: "@{vault:key}"\n')
+    (tmp_path / "vault.yaml").write_text("key: value\n")
+
+    monkeypatch.setenv("PIN_TEST_HOME", "one")
+    compile_config(str(tmp_path / "main.yaml"))
+    monkeypatch.setenv("PIN_TEST_HOME", "two")
+    conf = load_config(str(tmp_path / "main.yaml"))
+    assert load_snapshot(str(tmp_path / "main.yaml")) is not None
+    assert [conf.home, conf.key] == ["two", "value"]
+    assert load_config(str(tmp_path / "main.yaml"), to_container=True) == {"home": "two", "key": "value"}
+
+
+def test_load_configs():
+    folder = os.path.join(PROJECT_DIR.parent, 'tests/test_cli/test_config_files')
+    paths = [os.path.join(folder, file) for file in ['main.yaml', 'vault.yaml', 'subfolder/subconfig1.yaml']]
+    confs = load_config(paths, to_container=True)
+    assert confs == [load_config(path, to_container=True) for path in paths]
+    assert confs[0]["test2"]["item"] == "value"
+
+
+def test_split_imports():
+    segments = split_imports("a @{folder.vault:key1.key2} b @{other}")
+    assert segments == ["a ", ImportReference("@{folder.vault:key1.key2}", "folder/vault.yaml", ("key1", "key2")),
+                        " b ", ImportReference("@{other}", "other.yaml", ())]
+    assert join_imports(segments, lambda reference: reference.source) == "a folder/vault.yaml b other.yaml"
+    assert split_imports("no import") == ["no import"]
+
+
+def test_configs_in(tmp_path):
+    for file in ["b.yaml", "a.yml", "notes.txt", "main.yaml~", "sub/c.yaml", "__pincache__/d.yaml"]:
+        (tmp_path / file).parent.mkdir(exist_ok=True)
+        (tmp_path / file).write_text("key: value\n")
+
+    paths = [os.path.relpath(path, tmp_path) for path in configs_in(tmp_path, read=False)]
+    assert paths == ["a.yml", "b.yaml", "sub/c.yaml"]
+    assert [content for _, content in configs_in(tmp_path)] == ["key: value\n"] * 3
+
+
+def test_config_index(tmp_path):
+    (tmp_path / "a.yaml").write_text("key: value\n")
+    index = ConfigIndex(str(tmp_path / "index.json"))
+    index.update(str(tmp_path / "a.yaml"), file_stamp(tmp_path / "a.yaml"), {"imports": 1})
+    index.save()
+    index = ConfigIndex(str(tmp_path / "index.json"))
+    assert index.get(str(tmp_path / "a.yaml"), file_stamp(tmp_path / "a.yaml")) == {"imports": 1}
+    (tmp_path / "a.yaml").write_text("key: new value\n")
+    assert not index.is_unchanged(str(tmp_path / "a.yaml"), file_stamp(tmp_path / "a.yaml"))
+
+
+def test_update_nested_from_arguments():
+    path = os.path.join(PROJECT_DIR.parent,
+                        'tests/test_cli/test_config_files/main.yaml')
+    conf = load_config(path, to_container=True)
+    args = ["python main.py", "with", "test2.item=@{vault:key1}-@{vault:key2}", "'new.key = @{subfolder.subconfig2}'"]
+    new_conf = update_argv_from_arguments(args, conf, path)
+    assert args[2] == "'test2.item=value1-value2'"
+    assert args[3] == "'new.key={'test': 'value'}'"
+    assert new_conf["test2"]["item"] == "value1-value2"
+    assert new_conf["new"]["key"] == {"test": "value"}
+    assert conf["test2"]["item"] == "value"
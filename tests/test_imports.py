@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import pin
+
+HEAVY_MODULES = ["sacred", "omegaconf", "munch", "numpy", "ruamel.yaml", "torch"]
+
+
+def imported_modules(statement):
+    """
+    Returns: the modules imported by the statement in a new interpreter, from `python -X importtime`.
+    """
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).resolve().parents[1]))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], env=env, capture_output=True,
+                            text=True, check=True)
+    return {line.split("|")[-1].strip() for line in result.stderr.splitlines() if line.startswith("import time:")}
+
+
+@pytest.mark.parametrize("statement", ["import pin", "import pin.cli.main"])
+def test_heavy_modules_are_not_imported(statement):
+    modules = imported_modules(statement)
+    assert not [module for module in HEAVY_MODULES if module in modules]
+
+
+def test_lazy_attributes():
+    assert "Experiment" in dir(pin)
+    assert pin.Metrics.__module__ == "pin.metrics"
+    with pytest.raises(AttributeError):
+        pin.missing
@@ -0,0 +1,187 @@
+import time
+
+import numpy as np
+import pytest
+
+from pin.metrics import Metrics, PipeReducer, QuantileSketch, RingBuffer, RunningStats
+
+
+def test_running_stats():
+    values = np.random.default_rng(0).normal(3, 2, size=1000)
+    stats = RunningStats()
+    for value in values[:10]:
+        stats.add(value)
+    stats.extend(values[10:500])
+    other = RunningStats()
+    other.extend(values[500:])
+    stats.merge(other)
+    assert stats.count == 1000
+    assert stats.sum == pytest.approx(values.sum())
+    assert stats.mean == pytest.approx(values.mean())
+    assert stats.var == pytest.approx(values.var())
+    assert (stats.min, stats.max, stats.last) == (values.min(), values.max(), values[-1])
+
+
+def test_ring_buffer():
+    buffer = RingBuffer(5)
+    buffer.add(0)
+    buffer.extend([1, 2, 3])
+    assert buffer.values().tolist() == [0, 1, 2, 3]
+    buffer.extend([4, 5, 6])
+    assert buffer.values().tolist() == [2, 3, 4, 5, 6]
+    buffer.extend(range(10))
+    assert buffer.values().tolist() == [5, 6, 7, 8, 9]
+
+
+def test_metrics(capsys):
+    metrics = Metrics(print_every=2, history_size=3)
+    for step in range(4):
+        metrics.step(content_dict={"loss": step})
+    assert "loss: 3.000 (2.500)" in capsys.readouterr().out
+    assert metrics["loss"] == 1.5
+    assert metrics.stats("loss").max == 3
+    assert metrics.history("loss").tolist() == [1, 2, 3]
+    metrics.new_epoch()
+    metrics.extend("loss", [4, 6])
+    metrics.compute_average()
+    assert metrics["loss"] == 5
+
+
+def test_quantile_sketch():
+    values = np.random.default_rng(0).lognormal(size=20000) * np.sign(np.arange(20000) % 10 - 1)
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    for value in values[:100]:
+        sketch.add(value)
+    other = QuantileSketch(relative_accuracy=0.01)
+    other.extend(values[100:])
+    sketch.merge(other)
+    assert sketch.count == len(values)
+    for q in [0.01, 0.5, 0.95, 0.99]:
+        exact = np.sort(values)[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.011 * abs(exact)
+    assert sum(count for _, _, count in sketch.buckets()) == len(values)
+
+
+def test_quantile_sketch_non_finite_values():
+    metrics = Metrics(quantile_keys=["loss"])
+    metrics.add("loss", float("nan"))
+    metrics.add("loss", float("inf"))
+    metrics.extend("loss", [1., float("nan"), -float("inf"), 3.])
+    metrics.compute_average()
+    sketch = metrics.stats("loss").sketch
+    assert (sketch.count, sketch.non_finite_count) == (2, 4)
+    assert sketch.quantile(0) == pytest.approx(1, rel=0.01)
+    assert sketch.quantile(1) == pytest.approx(3, rel=0.01)
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.scalars = dict()
+        self.histograms = dict()
+
+    def add_scalar(self, tag, value, step):
+        self.scalars[tag] = value
+
+    def add_histogram_raw(self, tag, **kwargs):
+        self.histograms[tag] = kwargs
+
+
+def test_metrics_quantiles(capsys):
+    writer = RecordingWriter()
+    metrics = Metrics(writer, print_every=100, prefix="train", quantile_keys=["latency"], quantiles=(0.5, 0.99))
+    for step in range(100):
+        metrics.step(content_dict={"latency": step + 1, "loss": 1})
+    assert "latency: 100.000 (50.500) [p50: 49.903, p99: 98.505]" in capsys.readouterr().out
+    assert writer.scalars["train_latency_p99"] == pytest.approx(99, rel=0.01)
+    assert "train_loss_p50" not in writer.scalars
+    assert writer.histograms["train_latency"]["num"] == 100
+    assert metrics.quantile("latency", 0.5) == pytest.approx(50, rel=0.01)
+
+
+def test_metrics_reduce_arrays():
+    metrics = Metrics(print_every=10)
+    buffer = np.empty(2)
+    for value in [1, 2, 3]:
+        # Arrays are reduced when added, so they can be reused.
+        buffer.fill(value)
+        metrics.add("err", buffer)
+    metrics.add("err", np.array(2., dtype=np.float32))
+    assert metrics.buffer["err"].count == 7
+    assert not metrics.pending
+    metrics.compute_average()
+    assert metrics["err"] == 2
+
+
+def test_metrics_defer_tensors():
+    torch = pytest.importorskip("torch")
+    metrics = Metrics(print_every=10, history_size=10)
+    loss = torch.tensor([1., 2.], requires_grad=True)
+    metrics.add("loss", loss * 2)
+    metrics.extend("loss", [3, np.array(4.), torch.tensor(5, dtype=torch.int64)])
+    metrics.add_batch({"error": torch.tensor([0.5, 1.5], dtype=torch.float16), "accuracy": np.array([1, 0])})
+    # Tensors are detached and only converted by compute_average.
+    assert all(not tensor.requires_grad for tensors in metrics.pending.values() for tensor in tensors)
+    assert metrics.buffer["loss"].count == 2
+    metrics.compute_average()
+    assert not metrics.pending
+    assert np.isclose(metrics["loss"], 3.6)
+    assert metrics["error"] == 1
+    assert metrics["accuracy"] == 0.5
+    assert list(metrics.histories["loss"].values()) == [3., 4., 2., 4., 5.]
+
+
+def test_metrics_defer_mixed_values():
+    metrics = Metrics(print_every=10, history_size=10)
+    metrics.add("loss", np.array([1., 2.]))
+    metrics.extend("loss", [3, np.array(4., dtype=np.float16)])
+    metrics.add_batch({"error": np.array([0.5, 1.5]), "accuracy": [np.array([1, 0]), 1]})
+    metrics.compute_average()
+    assert metrics["loss"] == 2.5
+    assert metrics["error"] == 1
+    assert np.isclose(metrics["accuracy"], 2 / 3)
+    assert list(metrics.histories["loss"].values()) == [1., 2., 3., 4.]
+
+
+def test_metrics_add_batch():
+    values = np.random.default_rng(0).random((100, 3))
+    metrics = Metrics(history_size=10, quantile_keys=["error"])
+    metrics.add_batch({"error": values[:50], "accuracy": [1, 0, 1, 1]})
+    metrics.add_batch({"error": values[50:]})
+    metrics.compute_average()
+    assert metrics.stats("error").count == 300
+    assert metrics["error"] == pytest.approx(values.mean())
+    assert metrics["accuracy"] == 0.75
+    assert metrics.history("error").tolist() == values.reshape(-1)[-10:].tolist()
+    assert metrics.quantile("error", 0.5) == pytest.approx(np.median(values), rel=0.02)
+
+
+def test_metrics_pipe_reducer(capsys):
+    reducers = PipeReducer.create(3)
+    workers = [Metrics(print_every=2, reducer=reducer) for reducer in reducers[1:]]
+    for rank, worker in enumerate(workers):
+        worker.extend("loss", [rank + 1, rank + 1])
+        worker.step(step=2)
+        worker.reducer.flush()
+    assert capsys.readouterr().out == ""
+    metrics = Metrics(print_every=2, reducer=reducers[0])
+    metrics.extend("loss", [0, 0])
+    metrics.step(step=2)
+    assert "loss: 2.000 (1.000)" in capsys.readouterr().out
+    assert metrics.stats("loss").count == 6
+    assert metrics.stats("loss").var == pytest.approx(np.var([0, 0, 1, 1, 2, 2]))
+
+
+def test_metrics_pipe_reducer_does_not_block():
+    reducers = PipeReducer.create(2)
+    worker = Metrics(print_every=1, reducer=reducers[1], quantile_keys=["latency"])
+    values = np.random.default_rng(0).lognormal(size=(100, 1000))
+    # Rank 0 does not read the pipe while the worker prints.
+    for step, batch in enumerate(values):
+        worker.add_batch({"latency": batch})
+        worker.step(step=step + 1)
+    metrics = Metrics(print_every=1, reducer=reducers[0], quantile_keys=["latency"])
+    while "latency" not in metrics.metrics or metrics.stats("latency").count < values.size:
+        metrics.step(step=1)
+        time.sleep(0.01)
+    assert metrics.stats("latency").count == values.size
+    assert metrics.quantile("latency", 0.5) == pytest.approx(np.median(values), rel=0.02)
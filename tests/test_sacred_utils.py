@@ -1,5 +1,10 @@
 import inspect
-from pin.sacred import munchify
+import os
+
+from sacred.dependencies import Source, get_digest
+
+from pin.config import ConfigIndex
+from pin.sacred import add_dir_sources, munchify
 
 
 @munchify
@@ -9,3 +14,61 @@ def fake_main(_run, _config, param=1):
 
 def test_munchify():
     assert str(inspect.signature(fake_main)) == "(_run, _config, param=1)"
+
+
+class FakeExperiment:
+    save_git_info = False
+
+    def __init__(self):
+        self.sources = set()
+
+
+def test_add_dir_sources(tmp_path):
+    for file in ["main.py", "lib/model.py", "lib/data.cfg", "lib/gen_1.py", "build/out.py", "nested/deep/run.cfg"]:
+        (tmp_path / file).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / file).write_text(file)
+    (tmp_path / ".gitignore").write_text("# generated\nbuild/\ngen_*.py\n")
+
+    experiment = FakeExperiment()
+    add_dir_sources(experiment, tmp_path, allowed_exts=[".py", ".cfg"], exclude=["/lib/*.cfg"])
+    sources = {source.filename: source.digest for source in experiment.sources}
+    assert sorted(sources.keys()) == [str((tmp_path / file).resolve())
+                                      for file in ["lib/model.py", "main.py", "nested/deep/run.cfg"]]
+    assert sources[str((tmp_path / "main.py").resolve())] == get_digest(tmp_path / "main.py")
+
+    # Digests of unchanged files are read from the index.
+    index = ConfigIndex(str(tmp_path / "__pincache__" / "source_index.json"))
+    main_file = str((tmp_path / "main.py").resolve())
+    index.update(main_file, index.entries[main_file][0], "cached")
+    index.save()
+    (tmp_path / "lib/model.py").write_text("changed")
+    experiment = FakeExperiment()
+    add_dir_sources(experiment, tmp_path, allowed_exts=[".py", ".cfg"])
+    sources = {source.filename: source.digest for source in experiment.sources}
+    assert sources[main_file] == "cached"
+    assert sources[str((tmp_path / "lib/model.py").resolve())] == get_digest(tmp_path / "lib/model.py")
+
+
+def test_add_dir_sources_read_only_index(tmp_path, monkeypatch):
+    (tmp_path / "main.py").write_text("main")
+
+    def read_only(*args, **kwargs):
+        raise PermissionError("read-only")
+
+    monkeypatch.setattr("pin.sacred.os.replace", read_only)
+    experiment = FakeExperiment()
+    add_dir_sources(experiment, tmp_path)
+    # The sources are added without caching the digests.
+    assert [source.digest for source in experiment.sources] == [get_digest(tmp_path / "main.py")]
+    assert os.listdir(tmp_path / "__pincache__") == []
+
+
+def test_add_dir_sources_symlink(tmp_path):
+    (tmp_path / "main.py").write_text("main")
+    (tmp_path / "link.py").symlink_to(tmp_path / "main.py")
+    experiment = FakeExperiment()
+    add_dir_sources(experiment, tmp_path, index=False)
+    # Sources are named as by `Experiment.add_source_file`.
+    sources = {Source.create(str(tmp_path / file), save_git_info=False) for file in ["link.py", "main.py"]}
+    assert [(source.filename, source.digest) for source in experiment.sources] == [
+        (source.filename, source.digest) for source in sources]
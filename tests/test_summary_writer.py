@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from pin import SummaryWriter
+from pin.scalar_store import ScalarStoreReader
+
+
+class SacredRun:
+    def __init__(self, fail=False, event=None):
+        self.scalars = []
+        self.fail = fail
+        self.event = event
+
+    def log_scalar(self, name, value, step=None):
+        if self.event is not None:
+            self.event.wait()
+        if self.fail:
+            raise ConnectionError("observer unavailable")
+        self.scalars.append((name, value, step))
+
+
+def test_background_writer_drains_on_close():
+    run = SacredRun()
+    with SummaryWriter(sacred_run=run, background=True, batch_size=8, flush_interval=10) as writer:
+        for step in range(20):
+            writer.add_scalar("loss", step, step)
+        writer.add_scalars("accuracy", {"train": 1, "valid": 0.5}, 20)
+    assert run.scalars == [("loss", step, step) for step in range(20)] + [("accuracy_train", 1, 20),
+                                                                         ("accuracy_valid", 0.5, 20)]
+
+
+def test_background_writer_drops_when_full():
+    event = threading.Event()
+    run = SacredRun(event=event)
+    writer = SummaryWriter(sacred_run=run, background=True, batch_size=1, max_queue_size=2, block_when_full=False)
+    for step in range(10):
+        writer.add_scalar("loss", step, step)
+    event.set()
+    writer.flush()
+    assert writer.dropped > 0
+    assert len(run.scalars) == 10 - writer.dropped
+    writer.close()
+
+
+def test_background_writer_error():
+    writer = SummaryWriter(sacred_run=SacredRun(fail=True), background=True, flush_interval=0.01)
+    writer.add_scalar("loss", 1, 1)
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    writer.close()
+
+
+def test_scalar_store(tmp_path):
+    with SummaryWriter(scalar_store=tmp_path, background=True) as writer:
+        for step in range(10):
+            writer.add_scalar("loss", 1 / (step + 1), step)
+            writer.add_scalars("accuracy", {"train": step / 10}, step)
+    # A record truncated by a crash is ignored, then overwritten.
+    with open(tmp_path / "scalars.bin", "ab") as file:
+        file.write(b"trunc")
+    with SummaryWriter(scalar_store=tmp_path) as writer:
+        writer.add_scalar("loss", 0, 10)
+
+    reader = ScalarStoreReader(tmp_path)
+    assert reader.tags == ["loss", "accuracy_train"]
+    assert reader["loss"]["step"].tolist() == list(range(11))
+    assert reader["loss"]["value"].tolist() == [1 / (step + 1) for step in range(10)] + [0]
+    scalars = reader.scalars()
+    assert scalars["accuracy_train"]["value"].tolist() == [step / 10 for step in range(10)]
+    assert (scalars["loss"] == reader["loss"]).all()
+
+
+def test_scalar_store_truncated_tag(tmp_path):
+    with SummaryWriter(scalar_store=tmp_path) as writer:
+        writer.add_scalar("loss", 1, 0)
+    # A tag line truncated by a crash is ignored, then overwritten.
+    with open(tmp_path / "tags.jsonl", "a") as file:
+        file.write('"lr')
+    with SummaryWriter(scalar_store=tmp_path) as writer:
+        writer.add_scalar("grad", 2, 0)
+
+    reader = ScalarStoreReader(tmp_path)
+    assert reader.tags == ["loss", "grad"]
+    assert reader["grad"]["value"].tolist() == [2]